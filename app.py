@@ -5,7 +5,17 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.metrics import mean_absolute_percentage_error
+from collections import OrderedDict, deque
+import hashlib
+import hmac
 import io
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from openpyxl import load_workbook
 
 st.set_page_config(
     page_title="Ca' di Dio Forecast - ML Autopilot",
@@ -37,15 +47,9 @@ def calculate_mape(actual, forecast):
     mask = actual != 0
     return np.mean(np.abs((actual[mask] - forecast[mask]) / actual[mask])) * 100
 
-def optimize_weights_grid_search(baseline, year_prev, otb, actual_rn, actual_adr):
-    """Ottimizza i pesi usando grid search per minimizzare MAPE"""
-    
-    best_mape_rn = float('inf')
-    best_mape_adr = float('inf')
-    best_weights = None
-    
-    # Grid search: prova combinazioni di pesi
-    # Per velocità, usiamo step di 5%
+def weight_grid():
+    """Combinazioni di pesi (in %) testate dalla grid search, step 5%"""
+    grid = []
     for w1 in range(20, 51, 5):  # Baseline: 20-50%
         for w2 in range(15, 41, 5):  # Year: 15-40%
             for w3 in range(15, 41, 5):  # OTB: 15-40%
@@ -53,76 +57,771 @@ def optimize_weights_grid_search(baseline, year_prev, otb, actual_rn, actual_adr
                 
                 if w4 < 5 or w4 > 25:  # Pickup deve essere 5-25%
                     continue
-                
-                weights = {
-                    'baseline': w1 / 100,
-                    'year': w2 / 100,
-                    'otb': w3 / 100,
-                    'pickup': w4 / 100
-                }
-                
-                # Forecast RN senza Biennale (lo applichiamo dopo)
-                forecast_rn = (
-                    baseline['rn'] * weights['baseline'] +
-                    year_prev['rn'] * weights['year'] +
-                    otb['rn'] * weights['otb']
-                )
-                
-                forecast_adr = (
-                    baseline['adr'] * weights['baseline'] +
-                    year_prev['adr'] * weights['year'] +
-                    otb['adr'] * weights['otb']
-                )
-                
-                mape_rn = calculate_mape(actual_rn, forecast_rn)
-                mape_adr = calculate_mape(actual_adr, forecast_adr)
-                
-                # Metrica combinata (peso uguale a RN e ADR)
-                combined_mape = (mape_rn + mape_adr) / 2
-                
-                if combined_mape < (best_mape_rn + best_mape_adr) / 2:
-                    best_mape_rn = mape_rn
-                    best_mape_adr = mape_adr
-                    best_weights = weights
-    
-    return best_weights, best_mape_rn, best_mape_adr
-
-def calculate_forecast_simple(baseline, year_prev, otb, pickup, weights, biennale_adj, num_rooms, year_ago=None):
-    """Forecast con 4 o 5 componenti (year-ago opzionale)"""
-    
-    # Roomnights
-    rn = (
-        baseline['rn'] * weights['baseline'] +
-        year_prev['rn'] * weights['year'] +
-        otb['rn'] * weights['otb'] +
-        pickup['rn'] * weights['pickup']
-    )
+                grid.append((w1, w2, w3, w4))
+    return grid
+
+# Componenti del forecast -> sorgente dati allineata
+COMPONENT_SOURCES = {
+    'baseline': 'baseline_2324',
+    'year': 'year_2425',
+    'otb': 'otb_2026',
+    'pickup': 'pickup',
+    'year_ago': 'otb_yearago',
+}
+
+# Componenti validate dalla grid search (il pickup prende il peso restante)
+GRID_COMPONENTS = ['baseline', 'year', 'otb', 'pickup']
+
+SEGMENTATIONS = ["Nessuna", "Mese", "Giorno settimana", "Lead time"]
+WEEKDAY_LABELS = ['Lun', 'Mar', 'Mer', 'Gio', 'Ven', 'Sab', 'Dom']
+
+# Bucket di lead time (giorni dalla data report): limiti inferiori dei bucket successivi.
+# I giorni già trascorsi (lead negativo) hanno un bucket proprio
+LEAD_TIME_EDGES = [0, 14, 45]
+LEAD_TIME_LABELS = ['Passato', '0-13 gg', '14-44 gg', '45+ gg']
+
+# Blocchi di candidati della grid search: scandiscono progresso e annullamento del job
+OPTIMIZER_STEPS = 20
+
+def segment_ids(dates, segmentation, report_date):
+    """Segmento di ogni giorno target ed etichette dei segmenti"""
+    if segmentation == "Mese":
+        starts = np.array([start for start, _ in MONTH_WINDOWS.values()])
+        return np.searchsorted(starts, dates, side='right') - 1, [m.capitalize() for m in MONTH_WINDOWS]
+    if segmentation == "Giorno settimana":
+        # 1970-01-01 era giovedì: +3 porta il lunedì a 0
+        return (dates.astype('datetime64[D]').astype(np.int64) + 3) % 7, WEEKDAY_LABELS
+    if segmentation == "Lead time":
+        lead = (dates - np.datetime64(report_date.date())).astype(np.int64)
+        return np.digitize(lead, LEAD_TIME_EDGES), LEAD_TIME_LABELS
+    return np.zeros(len(dates), dtype=np.int64), ['Tutti']
+
+def daily_ape(actual, forecast):
+    """Errore percentuale assoluto giorno per giorno (NaN dove l'actual manca o è zero)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ape = np.abs((actual - forecast) / actual)
+    return np.where((actual != 0) & np.isfinite(actual), ape, np.nan)
+
+def segment_mape(ape, seg_mask):
+    """MAPE per segmento e candidato da un array 3-D segmento × candidato × giorno"""
+    cube = np.where(seg_mask[:, None, :], ape[None, :, :], np.nan)
+    valid = ~np.isnan(cube)
+    sums = np.where(valid, cube, 0.0).sum(axis=2)
+    counts = valid.sum(axis=2)
+    mape = np.divide(sums, counts, out=np.full(sums.shape, np.inf), where=counts > 0) * 100
+    return mape, sums, counts
+
+def optimize_segment_weights(X_rn, X_adr, actual_rn, actual_adr, actual_rev, segments, labels,
+                             job=None, chunk=None):
+    """Grid search batched: pesi RN e ADR indipendenti per segmento in un'unica valutazione vettoriale.
+
+    X_rn / X_adr hanno una riga per componente (baseline, year, otb) e una
+    colonna per giorno. Per ogni blocco di candidati gli errori giornalieri
+    sono ridotti per segmento su un array segmento × candidato × giorno;
+    l'ultimo segmento è l'intera stagione, usato per i segmenti senza dati.
+    Senza segmentazione si calcola anche il fronte di Pareto delle coppie
+    (pesi RN, pesi ADR).
+    """
+    grid = np.array(weight_grid(), dtype=np.float64) / 100
+    chunk = chunk or max(1, -(-len(grid) // OPTIMIZER_STEPS))
+    n_seg = len(labels)
+    seg_mask = np.vstack([segments[None, :] == np.arange(n_seg)[:, None], np.ones((1, len(segments)), bool)])
+    rows = np.arange(n_seg + 1)
     
-    # ADR  
-    adr = (
-        baseline['adr'] * weights['baseline'] +
-        year_prev['adr'] * weights['year'] +
-        otb['adr'] * weights['otb'] +
-        pickup['adr'] * weights['pickup']
-    )
+    # Per metrica: indice, MAPE e (somma errori, giorni) del miglior candidato per segmento
+    best = {
+        metric: {'idx': np.zeros(n_seg + 1, dtype=np.int64), 'mape': np.full(n_seg + 1, np.inf),
+                 'stats': np.zeros((n_seg + 1, 2))}
+        for metric in ['rn', 'adr']
+    }
+    season_mape = {'rn': np.empty(len(grid)), 'adr': np.empty(len(grid))}
+    
+    n_chunks = -(-len(grid) // chunk)
+    n_steps = n_chunks + (1 if n_seg == 1 else 0)
+    for i in range(n_chunks):
+        W = grid[i * chunk:(i + 1) * chunk, :3]
+        for metric, X, actual in [('rn', X_rn, actual_rn), ('adr', X_adr, actual_adr)]:
+            mape, sums, counts = segment_mape(daily_ape(actual, W @ X), seg_mask)
+            season_mape[metric][i * chunk:(i + 1) * chunk] = mape[n_seg]
+            
+            # RN e ADR scelti indipendentemente
+            local = mape.argmin(axis=1)
+            improved = mape[rows, local] < best[metric]['mape']
+            best[metric]['idx'][improved] = i * chunk + local[improved]
+            best[metric]['mape'][improved] = mape[rows, local][improved]
+            best[metric]['stats'][improved] = np.column_stack([sums[rows, local], counts[rows, local]])[improved]
+        
+        if job is not None:
+            job.report(i + 1, n_steps, segment_result(grid, labels, best))
+    
+    result = segment_result(grid, labels, best)
+    if n_seg == 1:
+        result['pareto'] = pareto_front(grid, X_rn, X_adr, actual_rev, season_mape)
+        if job is not None:
+            job.report(n_steps, n_steps, result)
+    return result
+
+def segment_result(grid, labels, best):
+    """Pesi e MAPE per segmento; i segmenti senza giorni validi usano i pesi dell'intera stagione"""
+    n_seg = len(labels)
+    result = {'labels': labels, 'weights': [{} for _ in labels]}
+    for metric in ['rn', 'adr']:
+        fallback = ~np.isfinite(best[metric]['mape'][:n_seg])
+        idx = np.where(fallback, best[metric]['idx'][n_seg], best[metric]['idx'][:n_seg])
+        stats = np.where(fallback[:, None], 0.0, best[metric]['stats'][:n_seg])
+        for segment_weights, i in zip(result['weights'], idx):
+            segment_weights[metric] = dict(zip(GRID_COMPONENTS, grid[i]))
+        
+        # MAPE complessivo dei pesi segmentati sull'intera stagione
+        sums, counts = stats.sum(axis=0)
+        result[f'mape_{metric}'] = best[metric]['mape'][:n_seg].tolist()
+        result[f'overall_mape_{metric}'] = sums / counts * 100 if counts else float('inf')
+        result[f'days_{metric}'] = stats[:, 1].astype(int).tolist()
+    return result
+
+def pareto_front(grid, X_rn, X_adr, actual_rev, season_mape, max_cells=2_000_000):
+    """Fronte di Pareto delle coppie (pesi RN, pesi ADR) su MAPE RN, MAPE ADR e MAPE Revenue.
+
+    MAPE RN e ADR dipendono ciascuno da un solo vettore di pesi; il revenue
+    giornaliero (RN × ADR) lega le due scelte. Tutte le coppie sono valutate
+    su un array candidato RN × candidato ADR × giorno, a blocchi di candidati
+    RN per limitare la memoria.
+    """
+    F_rn = grid[:, :3] @ X_rn
+    F_adr = grid[:, :3] @ X_adr
+    n = len(grid)
+    step = max(1, max_cells // (n * F_rn.shape[1]))
+    
+    mape_rev = np.empty((n, n))
+    for start in range(0, n, step):
+        ape = daily_ape(actual_rev, F_rn[start:start + step, None, :] * F_adr[None, :, :])
+        valid = ~np.isnan(ape)
+        sums = np.where(valid, ape, 0.0).sum(axis=2)
+        counts = valid.sum(axis=2)
+        mape_rev[start:start + step] = np.divide(sums, counts, out=np.full(sums.shape, np.inf), where=counts > 0) * 100
     
-    # Year-Ago (5° componente opzionale)
-    if year_ago is not None and 'year_ago' in weights:
-        rn += year_ago['rn'] * weights['year_ago']
-        adr += year_ago['adr'] * weights['year_ago']
+    # Scansione per MAPE Revenue crescente: una coppia è dominata se una coppia già
+    # vista ha anche MAPE RN e MAPE ADR non peggiori
+    rn_idx, adr_idx = np.divmod(np.arange(n * n), n)
+    rev = mape_rev.ravel()
+    pair_rn = season_mape['rn'][rn_idx]
+    pair_adr = season_mape['adr'][adr_idx]
+    order = np.lexsort((pair_adr, pair_rn, rev))
     
-    # Applica Biennale Adjustment
-    rn *= biennale_adj
-    adr *= biennale_adj
+    rn_rank = np.searchsorted(np.unique(season_mape['rn']), season_mape['rn'])
+    best_adr_by_rank = np.full(rn_rank.max() + 1, np.inf)
+    on_front = []
+    for k in order[np.isfinite(rev[order])]:
+        rank = rn_rank[rn_idx[k]]
+        if best_adr_by_rank[:rank + 1].min() <= pair_adr[k]:
+            continue
+        on_front.append(k)
+        best_adr_by_rank[rank] = pair_adr[k]
     
+    on_front = np.array(on_front, dtype=np.int64)
     return {
-        'rn': rn,
-        'adr': adr,
-        'revenue': rn * adr,
-        'occ': rn / num_rooms
+        'weights': [
+            {'rn': dict(zip(GRID_COMPONENTS, grid[rn_idx[k]])), 'adr': dict(zip(GRID_COMPONENTS, grid[adr_idx[k]]))}
+            for k in on_front
+        ],
+        'mape_rn': pair_rn[on_front].tolist(),
+        'mape_adr': pair_adr[on_front].tolist(),
+        'mape_rev': rev[on_front].tolist(),
+        'pairs': n * n
     }
 
+def pareto_default(pareto):
+    """Punto del fronte con MAPE RN + MAPE ADR minimo (a parità, MAPE Revenue minimo)"""
+    return int(np.lexsort((pareto['mape_rev'], np.add(pareto['mape_rn'], pareto['mape_adr'])))[0])
+
+def pareto_labels(pareto):
+    """Etichette dei punti del fronte per la selezione"""
+    return [
+        f"Punto {i} - RN {mape_rn:.2f}% | ADR {mape_adr:.2f}% | Revenue {mape_rev:.2f}%"
+        for i, (mape_rn, mape_adr, mape_rev) in enumerate(zip(pareto['mape_rn'], pareto['mape_adr'], pareto['mape_rev']))
+    ]
+
+def pareto_table(pareto):
+    """Fronte di Pareto in forma tabellare"""
+    return pd.DataFrame([
+        {
+            'Punto': i,
+            **{f"{component.capitalize()} RN": weights['rn'][component] for component in GRID_COMPONENTS},
+            **{f"{component.capitalize()} ADR": weights['adr'][component] for component in GRID_COMPONENTS},
+            'MAPE RN': mape_rn,
+            'MAPE ADR': mape_adr,
+            'MAPE Revenue': mape_rev
+        }
+        for i, (weights, mape_rn, mape_adr, mape_rev) in enumerate(zip(
+            pareto['weights'], pareto['mape_rn'], pareto['mape_adr'], pareto['mape_rev']
+        ))
+    ])
+
+def expand_segment_weights(segment_weights, segments, metric):
+    """Peso di ogni componente per ogni giorno target, dato il segmento del giorno"""
+    return {
+        component: np.array([w[metric][component] for w in segment_weights])[segments]
+        for component in segment_weights[0][metric]
+    }
+
+def segment_weights_table(result):
+    """Pesi RN/ADR e performance per segmento in forma tabellare"""
+    return pd.DataFrame([
+        {
+            'Segmento': label,
+            **{f"{component.capitalize()} RN": weights['rn'][component] for component in GRID_COMPONENTS},
+            **{f"{component.capitalize()} ADR": weights['adr'][component] for component in GRID_COMPONENTS},
+            'Giorni RN': days_rn,
+            'MAPE RN': mape_rn,
+            'Giorni ADR': days_adr,
+            'MAPE ADR': mape_adr
+        }
+        for label, weights, days_rn, mape_rn, days_adr, mape_adr in zip(
+            result['labels'], result['weights'], result['days_rn'], result['mape_rn'],
+            result['days_adr'], result['mape_adr']
+        )
+    ])
+
+# ============================================================================
+# AUTOPILOT IN BACKGROUND
+# ============================================================================
+
+# Worker condivisi tra sessioni e intervallo di aggiornamento UI (secondi)
+AUTOPILOT_WORKERS = int(os.environ.get('AUTOPILOT_WORKERS', 2))
+AUTOPILOT_POLL_SECONDS = 0.5
+
+# Valori in uso finché un job Autopilot non ha prodotto il primo risultato
+DEFAULT_WEIGHTS = {'baseline': 0.35, 'year': 0.25, 'otb': 0.25, 'pickup': 0.15}
+
+# Job il cui risultato mostrato in questo run non è ancora definitivo
+autopilot_pending = []
+
+# Job annullati o falliti: il risultato mostrato è parziale o di input precedenti
+autopilot_failed = []
+
+# Slot dei job richiesti in questo run (gli altri job della sessione vengono annullati)
+autopilot_requested = set()
+
+class JobCancelled(Exception):
+    """Sollevata nel worker quando l'utente annulla un job"""
+
+class OptimizationJob:
+    """Ottimizzazione eseguita in un thread worker con progresso, best-so-far e annullamento"""
+
+    def __init__(self, key, label):
+        self.key = key
+        self.label = label
+        self.progress = 0.0
+        self.best = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    def report(self, done, total, best=None):
+        """Aggiorna progresso e risultato parziale; interrompe il job se annullato"""
+        self.progress = done / total if total else 1.0
+        if best is not None:
+            self.best = best
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set() and self.result is None
+
+    @property
+    def running(self):
+        return self.future is not None and not self.future.done()
+
+def _run_job(job, fn, args):
+    try:
+        job.result = fn(*args, job=job)
+        job.progress = 1.0
+    except JobCancelled:
+        pass
+    except Exception as e:
+        job.error = e
+
+@st.cache_resource
+def job_executor():
+    """Pool di thread condiviso per le ottimizzazioni Autopilot"""
+    return ThreadPoolExecutor(max_workers=AUTOPILOT_WORKERS, thread_name_prefix='autopilot')
+
+def autopilot_job(slot, key, label, fn, *args):
+    """Avvia (una volta per chiave di input) un job e restituisce job e risultato da mostrare.
+
+    Finché il job è in corso si usa l'ultimo risultato completo dello slot,
+    oppure il best-so-far parziale se non ce n'è ancora uno.
+    """
+    jobs = st.session_state.setdefault('autopilot_jobs', {})
+    last_good = st.session_state.setdefault('autopilot_last_good', {})
+    autopilot_requested.add(slot)
+
+    job = jobs.get(slot)
+    submitted = job is None or job.key != key
+    if submitted:
+        if job is not None:
+            job.cancel()
+        job = OptimizationJob(key, label)
+        job.future = job_executor().submit(_run_job, job, fn, args)
+        jobs[slot] = job
+    record_stage(label, submitted)
+
+    if job.result is not None:
+        last_good[slot] = job.result
+        return job, job.result
+    if job.error is None and not job.cancelled:
+        autopilot_pending.append(job)
+    else:
+        autopilot_failed.append(job)
+    if slot in last_good:
+        return job, last_good[slot]
+    return job, job.best
+
+def release_unrequested_jobs():
+    """Annulla i job della sessione il cui slot non è più richiesto (es. ritorno a Manual).
+
+    Libera i worker condivisi; se lo slot torna in uso il job riparte da capo.
+    """
+    jobs = st.session_state.get('autopilot_jobs', {})
+    for slot in [slot for slot in jobs if slot not in autopilot_requested]:
+        jobs.pop(slot).cancel()
+
+def render_job_status(slot, job):
+    """Progresso, annullamento e riavvio di un job nella sidebar"""
+    if job.running:
+        st.sidebar.progress(job.progress, text=f"🔄 {job.label}: {job.progress:.0%}")
+        if st.sidebar.button("⏹️ Annulla", key=f"cancel_{slot}"):
+            job.cancel()
+            st.rerun()
+    elif job.error is not None:
+        st.sidebar.error(f"❌ {job.label}: {job.error}")
+    elif job.cancelled:
+        st.sidebar.warning(f"⏹️ {job.label} annullato - in uso l'ultimo risultato disponibile")
+        if st.sidebar.button("🔁 Riavvia", key=f"restart_{slot}"):
+            del st.session_state['autopilot_jobs'][slot]
+            st.rerun()
+
+# ============================================================================
+# CACHE CONDIVISA TRA SESSIONI
+# ============================================================================
+
+# Tetto di memoria della cache condivisa (MB), configurabile da ambiente
+SHARED_CACHE_MAX_MB = float(os.environ.get('SHARED_CACHE_MAX_MB', 512))
+
+# Token richiesto per i controlli admin della cache (vuoto = controlli disabilitati)
+CACHE_ADMIN_TOKEN = os.environ.get('CACHE_ADMIN_TOKEN', '')
+
+def estimate_nbytes(value):
+    """Stima l'occupazione in memoria di dataset e aggregati"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    # CompactFrame e array numpy; duck typing perché lo store sopravvive ai rerun
+    # dello script, che ridefiniscono le classi dell'app
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value)
+    return 64
+
+class SharedDatasetStore:
+    """Store di processo per dataset parsati e aggregati, indicizzato per hash del contenuto.
+
+    I valori sono restituiti senza copia e condivisi tra tutte le sessioni:
+    vanno trattati in sola lettura. Oltre il tetto di memoria si eliminano
+    le voci usate meno di recente (LRU).
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_or_compute(self, key, compute, label=None):
+        """Restituisce il valore in cache o lo calcola una sola volta per tutte le sessioni"""
+        with self._key_lock(key):
+            try:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        self._entries.move_to_end(key)
+                        entry['hits'] += 1
+                        entry['last_access'] = datetime.now()
+                        self.hits += 1
+                        return entry['value']
+                    self.misses += 1
+
+                value = compute()
+                nbytes = estimate_nbytes(value)
+
+                with self._lock:
+                    # Voci più grandi del tetto non vengono trattenute
+                    if nbytes <= self.max_bytes:
+                        self._entries[key] = {
+                            'value': value,
+                            'nbytes': nbytes,
+                            'label': label or str(key[0]),
+                            'hits': 0,
+                            'last_access': datetime.now()
+                        }
+                        self._evict()
+                return value
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+
+    def _evict(self):
+        total = sum(e['nbytes'] for e in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry['nbytes']
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        """Cambia il tetto di memoria ed elimina subito le voci in eccesso"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def resident_bytes(self):
+        with self._lock:
+            return sum(e['nbytes'] for e in self._entries.values())
+
+    def snapshot(self):
+        """Elenco delle voci residenti, dalla più recente"""
+        with self._lock:
+            return [
+                {
+                    'Voce': e['label'],
+                    'Chiave': str(key[1])[:12] if len(key) > 1 else '',
+                    'MB': e['nbytes'] / 1024 ** 2,
+                    'Hit': e['hits'],
+                    'Ultimo accesso': e['last_access'].strftime('%H:%M:%S')
+                }
+                for key, e in reversed(self._entries.items())
+            ]
+
+@st.cache_resource
+def shared_store():
+    """Unica istanza di SharedDatasetStore per processo"""
+    return SharedDatasetStore(int(SHARED_CACHE_MAX_MB * 1024 ** 2))
+
+# Thread di background senza sessione (cartella monitorata): non possono leggere la
+# cache_resource, quindi ricevono lo store condiviso esplicitamente
+_background = threading.local()
+
+def dataset_store():
+    """Store condiviso del thread corrente: quello assegnato ai thread di background, altrimenti shared_store"""
+    return getattr(_background, 'store', None) or shared_store()
+
+def file_content_key(file):
+    """Hash SHA-256 del contenuto di un file caricato (già calcolato per i file della cartella monitorata)"""
+    if getattr(file, 'content_key', None):
+        return file.content_key
+    return hashlib.sha256(file.getvalue()).hexdigest()
+
+def source_fingerprints(files_dict):
+    """Hash del contenuto per ogni sorgente dati (il pickup separato combina RN + ADR)"""
+    keys = {file_type: file_content_key(file) for file_type, file in files_dict.items()}
+    if 'pickup_generic' in keys:
+        keys['pickup'] = keys['pickup_generic']
+    elif 'pickup_rn' in keys and 'pickup_adr' in keys:
+        keys['pickup'] = hashlib.sha256((keys['pickup_rn'] + keys['pickup_adr']).encode()).hexdigest()
+    return keys
+
+# ============================================================================
+# PIPELINE INCREMENTALE
+# ============================================================================
+
+# Stadi della pipeline -> sorgenti di input da cui dipendono. Ogni risultato è
+# in cache sotto una chiave che contiene l'hash del contenuto dei suoi input:
+# sostituendo un file si ricalcolano solo gli stadi che ne dipendono.
+PIPELINE_STAGES = {
+    'Parsing': ['baseline_2324', 'year_2425', 'otb_2026', 'otb_yearago', 'pickup', 'budget'],
+    'Allineamento YoY': ['baseline_2324', 'year_2425', 'otb_2026', 'otb_yearago', 'pickup'],
+    'Aggregati mensili': ['otb_2026'],
+    'Calendario eventi': [],
+    'Forecast mensile': ['baseline_2324', 'year_2425', 'otb_2026', 'otb_yearago', 'pickup'],
+    'Serie giornaliere': ['baseline_2324', 'year_2425', 'otb_2026', 'otb_yearago', 'pickup', 'budget'],
+    'Serie grafici': ['baseline_2324', 'year_2425', 'otb_2026', 'otb_yearago', 'pickup', 'budget'],
+    'Ottimizzazione pesi': ['baseline_2324', 'year_2425', 'otb_2026'],
+    'Stima calendario eventi': ['baseline_2324', 'year_2425'],
+}
+
+# Stadio -> {'ricalcolati': n, 'riusati': n} per il run corrente dello script
+pipeline_log = {}
+
+def record_stage(stage, recomputed):
+    """Registra per il run corrente se un risultato dello stadio è stato ricalcolato o riusato"""
+    counts = pipeline_log.setdefault(stage, {'ricalcolati': 0, 'riusati': 0})
+    counts['ricalcolati' if recomputed else 'riusati'] += 1
+
+def pipeline_stage(stage, key, compute, label=None):
+    """get_or_compute sulla cache condivisa con traccia ricalcolato/riusato per stadio"""
+    recomputed = []
+
+    def run():
+        recomputed.append(True)
+        return compute()
+
+    value = dataset_store().get_or_compute((stage,) + key, run, label=label)
+    record_stage(stage, bool(recomputed))
+    return value
+
+def weights_digest(values):
+    """Hash breve di un array di pesi/moltiplicatori giornalieri per le chiavi di cache"""
+    return hashlib.sha256(values.tobytes()).hexdigest()[:16] if values is not None else None
+
+def changed_sources(previous_keys, keys):
+    """Sorgenti il cui contenuto è cambiato rispetto al run precedente"""
+    return sorted(
+        source for source in PIPELINE_STAGES['Parsing']
+        if previous_keys.get(source) != keys.get(source)
+    )
+
+def pipeline_report(log, changed):
+    """Per stadio: input cambiati e risultati ricalcolati / riusati"""
+    return pd.DataFrame([
+        {
+            'Stadio': stage,
+            'Dipende da': ', '.join(inputs) if inputs else '-',
+            'Input cambiati': ', '.join(s for s in inputs if s in changed) or '-',
+            'Ricalcolati': log.get(stage, {}).get('ricalcolati', 0),
+            'Riusati': log.get(stage, {}).get('riusati', 0)
+        }
+        for stage, inputs in PIPELINE_STAGES.items()
+    ])
+
+# ============================================================================
+# RAPPRESENTAZIONE COMPATTA DEI DATASET
+# ============================================================================
+
+# Colonne metriche effettivamente usate per ciascun tipo di report
+DAILY_METRIC_COLUMNS = ['Room nights', 'ADR Cam', 'Room Revenue']
+PICKUP_METRIC_COLUMNS = ['vs 7gg', 'ADR Room']
+BUDGET_METRIC_COLUMNS = ['Roomnights BDG', 'ADR Room BDG', 'Room Revenue BDG', 'Occ.% BDG']
+
+class CompactFrame:
+    """Dataset colonnare compatto: metriche float32/int32 e date datetime64[D] in sola lettura"""
+
+    def __init__(self, columns, dates=None, source_nbytes=0, report_date=None):
+        self.columns = columns
+        self.dates = dates
+        self.source_nbytes = source_nbytes
+        self.report_date = report_date
+        for arr in self._arrays():
+            arr.flags.writeable = False
+
+    def _arrays(self):
+        arrays = list(self.columns.values())
+        if self.dates is not None:
+            arrays.append(self.dates)
+        return arrays
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in self._arrays())
+
+def compact_column(series):
+    """Converte una colonna metrica in int32 se intera e senza buchi, altrimenti float32"""
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+    if not np.isnan(values).any() and np.array_equal(values, np.round(values)) \
+            and np.abs(values).max(initial=0) < 2 ** 31:
+        return values.astype(np.int32)
+    return values.astype(np.float32)
+
+def parse_day_column(series):
+    """Estrae le date (gg/mm/aaaa) da una colonna di giorni come datetime64[D]"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype='datetime64[D]')
+    text = series.astype(str).str.extract(r'(\d{1,2}/\d{1,2}/\d{2,4})', expand=False)
+    days = pd.to_datetime(text, format='%d/%m/%Y', errors='coerce')
+    short = days.isna() & text.notna()
+    if short.any():
+        days[short] = pd.to_datetime(text[short], format='%d/%m/%y', errors='coerce')
+    return days.to_numpy(dtype='datetime64[D]')
+
+def compact_frame(df, metric_columns, day_column=None, source_nbytes=0, report_date=None):
+    """Costruisce un CompactFrame con le sole colonne metriche presenti nel DataFrame"""
+    columns = {col: compact_column(df[col]) for col in metric_columns if col in df.columns}
+    dates = parse_day_column(df[day_column]) if day_column else None
+    return CompactFrame(columns, dates, source_nbytes, report_date)
+
+def nansum(values):
+    """Somma che ignora i valori mancanti, accumulata in float64"""
+    return np.nansum(values, dtype=np.float64)
+
+def nanmean(values):
+    """Media che ignora i valori mancanti (NaN se la finestra è vuota)"""
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    return values[valid].mean() if valid.any() else np.float64('nan')
+
+def memory_report(data):
+    """Occupazione per sorgente: DataFrame originale vs rappresentazione compatta"""
+    rows = []
+    for source, frame in data.items():
+        rows.append({
+            'Sorgente': source,
+            'Righe': len(frame),
+            'Colonne': len(frame.columns),
+            'Originale (KB)': frame.source_nbytes / 1024,
+            'Compatto (KB)': frame.nbytes / 1024,
+            'Riduzione': 1 - frame.nbytes / frame.source_nbytes if frame.source_nbytes else 0.0
+        })
+    return pd.DataFrame(rows)
+
+# ============================================================================
+# CLASSIFICAZIONE FILE DAL CONTENUTO
+# ============================================================================
+
+# Anno di inizio stagione -> tipo di report giornaliero
+SEASON_FILE_TYPES = {2023: 'baseline_2324', 2024: 'year_2425', 2025: 'otb_2026'}
+
+# Righe lette per riconoscere intestazione e prime date
+SNIFF_MAX_ROWS = 12
+
+YEARAGO_NAME_PATTERNS = ['yearago', 'year-ago', 'year_ago', '160234']
+
+def parse_cell_date(value):
+    """Data da una cella Excel (datetime o testo gg/mm/aaaa), None se assente"""
+    if isinstance(value, datetime):
+        return value
+    match = re.search(r'(\d{1,2})/(\d{1,2})/(\d{4})', str(value or ''))
+    if match:
+        try:
+            return datetime(int(match.group(3)), int(match.group(2)), int(match.group(1)))
+        except ValueError:
+            return None
+    return None
+
+def filename_report_date(name):
+    """Data report dal nome file (es: otb_2025-12-16.xlsx), None se assente"""
+    match = re.search(r'(\d{4})-(\d{2})-(\d{2})', name)
+    if match:
+        return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    return None
+
+def season_start_year(day):
+    """Anno di inizio della stagione invernale a cui appartiene un giorno"""
+    return day.year if day.month >= 8 else day.year - 1
+
+def classify_header(header, rows, name):
+    """Tipo di file dalla firma delle colonne e dalle prime date"""
+    if 'Roomnights BDG' in header:
+        return 'budget'
+
+    if 'Soggiorno' in header:
+        has_rn = 'vs 7gg' in header
+        has_adr = 'ADR Room' in header
+        if has_rn and has_adr:
+            return 'pickup_generic'
+        if has_rn:
+            return 'pickup_rn'
+        if has_adr:
+            return 'pickup_adr'
+        return None
+
+    if 'Giorno' in header:
+        col = header.index('Giorno')
+        days = [parse_cell_date(row[col]) for row in rows if col < len(row)]
+        days = [d for d in days if d is not None]
+        if not days:
+            return None
+        file_type = SEASON_FILE_TYPES.get(season_start_year(days[0]))
+        # Stessa stagione dell'anno precedente: OTB year-ago o consuntivo, in via provvisoria
+        # dal nome (la data report del parsing completo decide in resolve_season_report)
+        if file_type == 'year_2425' and any(p in name.lower() for p in YEARAGO_NAME_PATTERNS):
+            return 'otb_yearago'
+        return file_type
+
+    return None
+
+def sniff_workbook(file):
+    """Legge in read-only solo le prime righe del foglio per dedurne il tipo"""
+    def sniff():
+        result = {'file_type': None}
+        try:
+            wb = load_workbook(io.BytesIO(file.getvalue()), read_only=True, data_only=True)
+        except Exception:
+            return result
+        try:
+            # openpyxl read-only legge il foglio in streaming: si ferma dopo SNIFF_MAX_ROWS righe
+            rows = list(wb.worksheets[0].iter_rows(max_row=SNIFF_MAX_ROWS, values_only=True))
+        finally:
+            wb.close()
+
+        # La riga di intestazione è la prima con colonne note
+        signature = {'Giorno', 'Soggiorno', 'vs 7gg', 'ADR Room', 'Roomnights BDG'}
+        for i, row in enumerate(rows):
+            header = [str(c).strip() if c is not None else '' for c in row]
+            if signature & set(header):
+                result['file_type'] = classify_header(header, rows[i + 1:], file.name)
+                break
+        return result
+
+    return dataset_store().get_or_compute(
+        ('sniff', file_content_key(file), file.name), sniff, label=f"sniff {file.name}"
+    )
+
 def identify_file_type(file):
+    """Identifica il tipo di file dal contenuto, con fallback sul nome"""
+    file_type = sniff_workbook(file)['file_type']
+    if file_type in ('year_2425', 'otb_yearago'):
+        return resolve_season_report(file, file_type)
+    if file_type:
+        return file_type
+    return identify_file_type_by_name(file)
+
+def resolve_season_report(file, file_type):
+    """Consuntivo 2024-25 o OTB year-ago: hanno la stessa firma, li distingue la data report.
+
+    Un OTB year-ago è una fotografia presa prima dell'ultimo giorno di
+    soggiorno, il consuntivo è estratto dopo. La riga Filtri chiude l'export,
+    quindi la data si legge dal parsing completo (condiviso in cache con il
+    caricamento); senza riga Filtri resta la scelta dal nome di classify_header.
+    """
+    try:
+        frame = load_dataset(file_type, file, file_content_key(file))
+    except Exception:
+        return file_type
+    if frame.report_date is None or not len(frame.dates):
+        return file_type
+    return 'otb_yearago' if np.datetime64(frame.report_date, 'D') < frame.dates.max() else 'year_2425'
+
+def report_date_for(frame, file):
+    """Data report: riga Filtri letta nel parsing, poi nome file (None se assente)"""
+    return frame.report_date or filename_report_date(file.name)
+
+def identify_file_type_by_name(file):
     """Identifica il tipo di file in modo flessibile"""
     name = file.name.lower()
     
@@ -152,10 +851,7 @@ def identify_file_type(file):
         return 'otb_2026'
     
     # OTB Year-Ago (previous year same date)
-    otb_yearago_patterns = [
-        'yearago', 'year-ago', 'year_ago', '160234'
-    ]
-    if any(pattern in name for pattern in otb_yearago_patterns):
+    if any(pattern in name for pattern in YEARAGO_NAME_PATTERNS):
         return 'otb_yearago'
     
     # Pickup RN (roomnights) - File con vs 7gg
@@ -187,60 +883,904 @@ def identify_file_type(file):
     
     return None
 
-@st.cache_data
+def read_report(file):
+    """Legge il primo foglio di un file caricato e ne misura l'occupazione originale"""
+    df = pd.read_excel(io.BytesIO(file.getvalue()))
+    return df, int(df.memory_usage(deep=True).sum())
+
+def parse_daily_report(file):
+    """Legge un report giornaliero tenendo solo le righe con data (esclude totali e filtri)"""
+    df, source_nbytes = read_report(file)
+    # Data report dalla riga Filtri che chiude l'export
+    filtri = df['Giorno'][df['Giorno'].str.contains('Filtri', na=False)]
+    report_date = parse_cell_date(filtri.iloc[-1]) if len(filtri) else None
+    dated = (df['Giorno'].str.contains('/', na=False) &
+             ~df['Giorno'].str.contains('Filtri', na=False)).to_numpy()
+    # I giorni sono un blocco contiguo prima di totali e filtri: basta una slice di righe
+    rows = np.flatnonzero(dated)
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        df = df.iloc[rows[0]:rows[-1] + 1]
+    else:
+        df = df[dated]
+    return compact_frame(df, DAILY_METRIC_COLUMNS, 'Giorno', source_nbytes, report_date)
+
+def parse_pickup_report(file):
+    """Legge un report pickup tenendo solo le righe con Soggiorno valorizzato"""
+    df, source_nbytes = read_report(file)
+    return df[df['Soggiorno'].notna()], source_nbytes
+
+def parse_budget_report(file):
+    """Legge il budget mensile (una riga per mese)"""
+    df, source_nbytes = read_report(file)
+    return compact_frame(df, BUDGET_METRIC_COLUMNS, source_nbytes=source_nbytes)
+
+def parse_unified_pickup(file):
+    """Legge un file pickup unificato (vs 7gg e ADR Room nello stesso report)"""
+    df, source_nbytes = parse_pickup_report(file)
+    return compact_frame(df, PICKUP_METRIC_COLUMNS, 'Soggiorno', source_nbytes)
+
+# Tipo file -> parser del dataset (i pickup RN/ADR separati sono uniti in load_data_from_uploads)
+DATASET_PARSERS = {
+    'baseline_2324': parse_daily_report,
+    'year_2425': parse_daily_report,
+    'otb_2026': parse_daily_report,
+    'otb_yearago': parse_daily_report,
+    'pickup_generic': parse_unified_pickup,
+    'budget': parse_budget_report,
+}
+
+def load_dataset(file_type, file, key, label=None):
+    """Dataset parsato di un file, dalla cache condivisa per hash del contenuto"""
+    return pipeline_stage('Parsing', (key,), lambda: DATASET_PARSERS[file_type](file), label=label or file_type)
+
 def load_data_from_uploads(files_dict):
+    """Carica i dataset passando dalla cache condivisa (un solo parsing per contenuto)"""
+    keys = source_fingerprints(files_dict)
     data = {}
     try:
         for key in ['baseline_2324', 'year_2425', 'otb_2026']:
-            df = pd.read_excel(files_dict[key])
-            data[key] = df[df['Giorno'].str.contains('/', na=False) & 
-                          ~df['Giorno'].str.contains('Filtri', na=False)].copy()
-        
+            data[key] = load_dataset(key, files_dict[key], keys[key])
+
         # OTB Year-Ago (opzionale)
         if 'otb_yearago' in files_dict:
-            df = pd.read_excel(files_dict['otb_yearago'])
-            data['otb_yearago'] = df[df['Giorno'].str.contains('/', na=False) & 
-                                    ~df['Giorno'].str.contains('Filtri', na=False)].copy()
+            data['otb_yearago'] = load_dataset('otb_yearago', files_dict['otb_yearago'], keys['otb_yearago'])
             st.sidebar.success("✅ OTB Year-Ago caricato - Modello a 5 componenti attivo!")
-        
+
         # Gestione Pickup - supporta sia file unificato che separati
         if 'pickup_generic' in files_dict:
             # File unificato - usa direttamente
-            df = pd.read_excel(files_dict['pickup_generic'])
-            data['pickup'] = df[df['Soggiorno'].notna()].copy()
-            
+            data['pickup'] = load_dataset('pickup_generic', files_dict['pickup_generic'], keys['pickup'], 'pickup')
+
         elif 'pickup_rn' in files_dict and 'pickup_adr' in files_dict:
             # File separati - merge automatico
-            df_rn = pd.read_excel(files_dict['pickup_rn'])
-            df_adr = pd.read_excel(files_dict['pickup_adr'])
-            
-            # Pulisci dataframe
-            df_rn = df_rn[df_rn['Soggiorno'].notna()].copy()
-            df_adr = df_adr[df_adr['Soggiorno'].notna()].copy()
-            
-            # Seleziona colonne rilevanti
-            df_rn_clean = df_rn[['Soggiorno', 'vs 7gg']].copy()
-            df_adr_clean = df_adr[['Soggiorno', 'ADR Room']].copy()
-            
-            # Merge automatico
-            df_merged = pd.merge(df_rn_clean, df_adr_clean, on='Soggiorno', how='inner')
-            data['pickup'] = df_merged
-            
+            def merge_pickups():
+                df_rn, nbytes_rn = parse_pickup_report(files_dict['pickup_rn'])
+                df_adr, nbytes_adr = parse_pickup_report(files_dict['pickup_adr'])
+
+                # Seleziona colonne rilevanti
+                df_rn_clean = df_rn[['Soggiorno', 'vs 7gg']]
+                df_adr_clean = df_adr[['Soggiorno', 'ADR Room']]
+
+                # Merge automatico
+                df_merged = pd.merge(df_rn_clean, df_adr_clean, on='Soggiorno', how='inner')
+                return compact_frame(df_merged, PICKUP_METRIC_COLUMNS, 'Soggiorno', nbytes_rn + nbytes_adr)
+
+            data['pickup'] = pipeline_stage('Parsing', (keys['pickup'],), merge_pickups, label='pickup')
+
             st.sidebar.success("🔄 Pickup RN + ADR uniti automaticamente!")
-        
+
         # Budget
-        data['budget'] = pd.read_excel(files_dict['budget'])
-        
-        return data
+        data['budget'] = load_dataset('budget', files_dict['budget'], keys['budget'])
+
+        return data, keys
     except Exception as e:
         st.error(f"Errore caricamento: {e}")
-        return None
+        return None, None
+
+# ============================================================================
+# CARTELLA MONITORATA (EXPORT AUTOMATICI PMS)
+# ============================================================================
+
+# Cartella di default, intervallo di scansione e tempo di quiete prima di leggere un file (secondi)
+DROP_FOLDER = os.environ.get('DROP_FOLDER', '')
+WATCH_POLL_SECONDS = float(os.environ.get('WATCH_POLL_SECONDS', 2))
+WATCH_DEBOUNCE_SECONDS = float(os.environ.get('WATCH_DEBOUNCE_SECONDS', 5))
+
+class DroppedFile:
+    """File letto dalla cartella monitorata, con la stessa interfaccia usata per gli upload (name, getvalue)"""
 
-def calc_pickup_adr(df_slice):
-    pos = df_slice[df_slice['vs 7gg'] > 0]
-    if len(pos) > 0 and pos['vs 7gg'].sum() > 0:
-        return (pos['ADR Room'] * pos['vs 7gg']).sum() / pos['vs 7gg'].sum()
-    return df_slice['ADR Room'].mean()
+    def __init__(self, path, content, mtime):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.mtime = mtime
+        self.content_key = hashlib.sha256(content).hexdigest()
+        self._content = content
+
+    def getvalue(self):
+        return self._content
+
+class FolderWatcher:
+    """Scansione periodica di una cartella in un thread di background.
+
+    Un file è letto solo dopo essere rimasto invariato (dimensione e mtime)
+    per WATCH_DEBOUNCE_SECONDS, così le scritture parziali del PMS vengono
+    ignorate. I contenuti già visti (hash SHA-256) non vengono riletti; i
+    nuovi sono classificati con identify_file_type e parsati nella cache
+    condivisa prima di diventare il file corrente del loro tipo. Un file
+    che non si riesce a leggere resta nel log con l'errore e viene
+    ritentato dopo un nuovo debounce.
+    """
+
+    def __init__(self, path, store):
+        self.path = path
+        self.store = store
+        self.version = 0
+        self.files = {}
+        self.seen = {}
+        self.log = deque(maxlen=50)
+        self.error = None
+        self._pending = {}
+        self._processed = {}
+        self._failed = {}
+        self._changed = threading.Condition()
+
+    def start(self):
+        # Nessun contesto di sessione: il watcher vive quanto il processo, non quanto la sessione che lo avvia
+        threading.Thread(target=self._run, name=f"watch {self.path}", daemon=True).start()
+
+    def _run(self):
+        _background.store = self.store
+        while True:
+            try:
+                self.scan()
+                self.error = None
+            except Exception as e:
+                # Errore sulla cartella (non su un singolo file): registrato una volta finché persiste
+                if str(e) != str(self.error):
+                    self._record(self.path, None, f"errore: {e}")
+                self.error = e
+            time.sleep(WATCH_POLL_SECONDS)
+
+    def scan(self, now=None):
+        """Un passo di scansione: avanza il debounce e acquisisce i file stabili"""
+        now = time.time() if now is None else now
+        for entry in os.scandir(self.path):
+            # Esclusi i file temporanei/lock di Excel
+            if not entry.is_file() or not entry.name.lower().endswith('.xlsx') or entry.name.startswith(('~$', '.')):
+                continue
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._processed.get(entry.path) == signature:
+                continue
+            
+            pending = self._pending.get(entry.path)
+            if pending is None or pending[0] != signature:
+                self._pending[entry.path] = (signature, now)
+                continue
+            if now - pending[1] < WATCH_DEBOUNCE_SECONDS:
+                continue
+            
+            try:
+                self.ingest(entry.path, stat.st_mtime)
+            except Exception as e:
+                # Ritentato dopo un nuovo debounce; nel log una sola volta per versione del file
+                self._pending[entry.path] = (signature, now)
+                if self._failed.get(entry.path) != signature:
+                    self._failed[entry.path] = signature
+                    self._record(entry.path, None, f"errore: {e}")
+                continue
+            del self._pending[entry.path]
+            self._failed.pop(entry.path, None)
+            self._processed[entry.path] = signature
+
+    def ingest(self, path, mtime):
+        """Classifica e parsa un file stabile; diventa il file corrente del suo tipo se più recente"""
+        with open(path, 'rb') as f:
+            file = DroppedFile(path, f.read(), mtime)
+        
+        if file.content_key in self.seen:
+            self._record(path, self.seen[file.content_key], "già acquisito")
+            return
+        file_type = identify_file_type(file)
+        if file_type is None:
+            self.seen[file.content_key] = None
+            self._record(path, None, "non riconosciuto")
+            return
+        current = self.files.get(file_type)
+        if current is not None and current.mtime > mtime:
+            self.seen[file.content_key] = file_type
+            self._record(path, file_type, "più vecchio del corrente")
+            return
+        
+        if file_type in DATASET_PARSERS:
+            load_dataset(file_type, file, file.content_key)
+        with self._changed:
+            self.seen[file.content_key] = file_type
+            self.files[file_type] = file
+            self.version += 1
+            self._changed.notify_all()
+        self._record(path, file_type, "acquisito")
+
+    def _record(self, path, file_type, outcome):
+        self.log.appendleft({'Ora': datetime.now(), 'File': os.path.basename(path) or path,
+                             'Tipo': file_type or '-', 'Esito': outcome})
+
+    def snapshot(self):
+        """File correnti per tipo e versione a cui si riferiscono"""
+        with self._changed:
+            return list(self.files.values()), self.version
+
+    def wait_for_change(self, version, timeout):
+        """Attende fino a timeout secondi un'acquisizione successiva a version"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version != version, timeout)
+
+def listen_for_drops(watcher, version, status):
+    """Resta in ascolto fino alla prossima acquisizione, poi riesegue lo script.
+
+    L'aggiornamento del placeholder di stato restituisce il controllo a
+    Streamlit, così le interazioni dell'utente interrompono l'attesa con un
+    normale rerun.
+    """
+    while not watcher.wait_for_change(version, WATCH_POLL_SECONDS):
+        status.caption(f"👀 In ascolto su {watcher.path} - ultimo controllo {datetime.now():%H:%M:%S}")
+    st.rerun()
+
+@st.cache_resource
+def folder_watcher():
+    """Un solo watcher, sulla cartella configurata in DROP_FOLDER, condiviso tra le sessioni"""
+    watcher = FolderWatcher(os.path.abspath(DROP_FOLDER), shared_store())
+    watcher.start()
+    return watcher
+
+# ============================================================================
+# ALLINEAMENTO YEAR-OVER-YEAR PER GIORNO DELLA SETTIMANA
+# ============================================================================
+
+# Finestra di soggiorno prevista (fine esclusa)
+SEASON_START = np.datetime64('2025-12-01')
+SEASON_END = np.datetime64('2026-03-01')
+
+# Mesi della stagione: chiave -> (primo giorno, primo giorno del mese successivo)
+MONTH_WINDOWS = {
+    'dic': (np.datetime64('2025-12-01'), np.datetime64('2026-01-01')),
+    'gen': (np.datetime64('2026-01-01'), np.datetime64('2026-02-01')),
+    'feb': (np.datetime64('2026-02-01'), np.datetime64('2026-03-01')),
+}
+
+# Sfasamento in giorni di ogni sorgente rispetto alla data target:
+# multipli di 364 mantengono lo stesso giorno della settimana
+SOURCE_LAGS = {
+    'baseline_2324': 728,
+    'year_2425': 364,
+    'otb_2026': 0,
+    'otb_yearago': 364,
+    'pickup': 0,
+}
+
+def season_dates():
+    """Date target della stagione come datetime64[D]"""
+    return np.arange(SEASON_START, SEASON_END, dtype='datetime64[D]')
+
+def date_window(dates, start, stop):
+    """Finestra [start, stop) di date ordinate come slice: gli array ne restano viste, senza copie"""
+    return slice(*np.searchsorted(dates, [start, stop]))
+
+def month_days(month):
+    start, stop = MONTH_WINDOWS[month]
+    return int((stop - start).astype(int))
+
+def alignment_index(frame, target_dates, lag):
+    """Indici di riga della controparte (target - lag) di ogni data target, con maschera di validità"""
+    counterpart = target_dates - np.timedelta64(lag, 'D')
+    if len(frame) == 0:
+        return np.zeros(len(target_dates), dtype=np.intp), np.zeros(len(target_dates), dtype=bool)
+    order = np.argsort(frame.dates, kind='stable')
+    sorted_dates = frame.dates[order]
+    pos = np.minimum(np.searchsorted(sorted_dates, counterpart), len(sorted_dates) - 1)
+    valid = sorted_dates[pos] == counterpart
+    return order[pos], valid
+
+def align_columns(frame, target_dates, lag):
+    """Tutte le metriche di un dataset sulle date target con un unico take vettoriale (NaN senza controparte)"""
+    idx, valid = alignment_index(frame, target_dates, lag)
+    columns = {
+        name: np.where(valid, np.take(col, idx).astype(np.float64), np.nan)
+        for name, col in frame.columns.items()
+    }
+    return valid, columns
+
+def aligned_source(data, data_keys, source):
+    """Tutte le metriche di una sorgente allineate sulle date target della stagione"""
+    def compute():
+        dates = season_dates()
+        valid, columns = align_columns(data[source], dates, SOURCE_LAGS[source])
+        return {'dates': dates, 'valid': valid, 'columns': columns}
+
+    return pipeline_stage(
+        'Allineamento YoY', (data_keys[source], SOURCE_LAGS[source], str(SEASON_START), str(SEASON_END)),
+        compute, label=f"{source} allineato"
+    )
+
+def aligned_totals(data, data_keys, source, start, stop):
+    """Totale RN e ADR medio di un report giornaliero sulle date target [start, stop), condivisi tra sessioni"""
+    def compute():
+        aligned = aligned_source(data, data_keys, source)
+        window_slice = date_window(aligned['dates'], start, stop)
+        window = {name: col[window_slice] for name, col in aligned['columns'].items()}
+        return {
+            'rn': nansum(window['Room nights']),
+            'adr': nanmean(window['ADR Cam']),
+            'revenue': nansum(window['Room Revenue'])
+        }
+
+    return pipeline_stage(
+        'Aggregati mensili', (data_keys[source], SOURCE_LAGS[source], str(start), str(stop)),
+        compute, label=f"{source} [{start} → {stop}]"
+    )
+
+def alignment_report(data, data_keys):
+    """Per sorgente: periodo storico corrispondente e giorni target coperti"""
+    rows = []
+    for source in SOURCE_LAGS:
+        if source not in data:
+            continue
+        aligned = aligned_source(data, data_keys, source)
+        lag = np.timedelta64(SOURCE_LAGS[source], 'D')
+        rows.append({
+            'Sorgente': source,
+            'Sfasamento (gg)': SOURCE_LAGS[source],
+            'Dal': str(SEASON_START - lag),
+            'Al': str(SEASON_END - np.timedelta64(1, 'D') - lag),
+            'Giorni coperti': int(aligned['valid'].sum()),
+            'Giorni target': len(aligned['valid'])
+        })
+    return pd.DataFrame(rows)
+
+# ============================================================================
+# CALENDARIO EVENTI
+# ============================================================================
+
+# Eventi di Venezia con periodi datati (inizio e fine incluse) e moltiplicatori
+# di default su RN e ADR. La "Stagione Biennale Arte" copre le stagioni che
+# precedono un'edizione Arte e sostituisce il vecchio fattore Biennale unico.
+VENICE_EVENTS = [
+    {'evento': 'Stagione Biennale Arte', 'rn': 1.10, 'adr': 1.10,
+     'periodi': [('2023-11-01', '2024-11-24'), ('2025-11-01', '2026-11-22')]},
+    {'evento': 'Carnevale', 'rn': 1.00, 'adr': 1.00,
+     'periodi': [('2024-01-27', '2024-02-13'), ('2025-02-22', '2025-03-04'), ('2026-01-31', '2026-02-17')]},
+    {'evento': 'Vernice Biennale Arte', 'rn': 1.00, 'adr': 1.00,
+     'periodi': [('2024-04-17', '2024-04-19'), ('2026-05-06', '2026-05-08')]},
+    {'evento': 'Vernice Biennale Architettura', 'rn': 1.00, 'adr': 1.00,
+     'periodi': [('2025-05-08', '2025-05-09')]},
+    {'evento': 'Redentore', 'rn': 1.00, 'adr': 1.00,
+     'periodi': [('2024-07-20', '2024-07-21'), ('2025-07-19', '2025-07-20'), ('2026-07-18', '2026-07-19')]},
+    {'evento': 'Mostra del Cinema', 'rn': 1.00, 'adr': 1.00,
+     'periodi': [('2024-08-28', '2024-09-07'), ('2025-08-27', '2025-09-06'), ('2026-09-02', '2026-09-12')]},
+]
+
+def calendar_version(events):
+    """Hash di periodi e moltiplicatori: cambia solo se cambia il calendario"""
+    payload = json.dumps(events, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def event_indicators(events, dates):
+    """Matrice giorni × eventi: 1 se l'evento è attivo nel giorno"""
+    indicators = np.zeros((len(dates), len(events)))
+    for j, event in enumerate(events):
+        for start, end in event['periodi']:
+            indicators[:, j] += (dates >= np.datetime64(start)) & (dates <= np.datetime64(end))
+    return np.minimum(indicators, 1.0)
+
+def expand_event_calendar(events):
+    """Moltiplicatori RN e ADR per ogni giorno della stagione, una volta per versione del calendario.
+
+    Oltre ai giorni target, 'lagged' contiene i moltiplicatori dei giorni
+    storici di ogni sfasamento di SOURCE_LAGS (vedi source_multipliers).
+    """
+    version = calendar_version(events)
+
+    def compute():
+        dates = season_dates()
+        log_rn_mult = np.log([e['rn'] for e in events])
+        log_adr_mult = np.log([e['adr'] for e in events])
+
+        def multipliers(days):
+            # Eventi sovrapposti: i moltiplicatori si compongono
+            active = event_indicators(events, days)
+            return {'rn': np.exp(active @ log_rn_mult), 'adr': np.exp(active @ log_adr_mult)}
+
+        lagged = {lag: multipliers(dates - np.timedelta64(lag, 'D')) for lag in set(SOURCE_LAGS.values())}
+        return {'dates': dates, **multipliers(dates), 'lagged': lagged, 'version': version}
+
+    return pipeline_stage('Calendario eventi', (version,), compute, label="calendario eventi")
+
+def source_multipliers(calendar, source):
+    """Moltiplicatori RN e ADR di una sorgente: eventi del giorno target su eventi del giorno storico.
+
+    Ogni sorgente contiene già gli eventi del proprio anno, e il fit
+    (fit_event_multipliers) stima proprio l'effetto della differenza tra
+    eventi attivi nei due giorni. Un evento mobile non si conta quindi due
+    volte, e le sorgenti senza sfasamento (OTB, pickup) restano invariate.
+    """
+    lagged = calendar['lagged'][SOURCE_LAGS[source]]
+    return calendar['rn'] / lagged['rn'], calendar['adr'] / lagged['adr']
+
+def fit_event_multipliers(events, target_dates, arte, architettura, job=None):
+    """Stima congiunta di tutti i moltiplicatori evento con un unico passo ai minimi quadrati.
+
+    Per ogni giorno target, log(Arte / Architettura) di RN e ADR è spiegato dalla
+    differenza degli eventi attivi nei due giorni storici allineati. RN e ADR
+    sono risolti insieme come due colonne della stessa lstsq. Gli eventi mai
+    attivi nella storia disponibile mantengono il moltiplicatore corrente.
+    """
+    if job is not None:
+        job.report(0, 1)
+
+    lag_arte = np.timedelta64(SOURCE_LAGS['baseline_2324'], 'D')
+    lag_arch = np.timedelta64(SOURCE_LAGS['year_2425'], 'D')
+    design = event_indicators(events, target_dates - lag_arte) - event_indicators(events, target_dates - lag_arch)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        targets = np.column_stack([
+            np.log(arte['Room nights'] / architettura['Room nights']),
+            np.log(arte['ADR Cam'] / architettura['ADR Cam'])
+        ])
+    usable = np.isfinite(targets).all(axis=1)
+    identified = np.abs(design[usable]).sum(axis=0) > 0
+
+    coef = np.zeros((len(events), 2))
+    if usable.any() and identified.any():
+        coef[identified], *_ = np.linalg.lstsq(design[usable][:, identified], targets[usable], rcond=None)
+
+    fitted = []
+    for j, event in enumerate(events):
+        if identified[j]:
+            fitted.append(dict(event, rn=float(np.exp(coef[j, 0])), adr=float(np.exp(coef[j, 1]))))
+        else:
+            fitted.append(dict(event))
+
+    # Qualità: Architettura × moltiplicatori stimati vs Arte reale, giorno per giorno
+    predicted = np.exp(design[usable] @ coef)
+    mape_rn = calculate_mape(arte['Room nights'][usable], architettura['Room nights'][usable] * predicted[:, 0])
+    mape_adr = calculate_mape(arte['ADR Cam'][usable], architettura['ADR Cam'][usable] * predicted[:, 1])
+
+    if job is not None:
+        job.report(1, 1)
+
+    return {
+        'events': fitted,
+        'identified': [e['evento'] for e, ok in zip(events, identified) if ok],
+        'mape_rn': mape_rn,
+        'mape_adr': mape_adr,
+        'n_days': int(usable.sum())
+    }
+
+def events_table(events, identified=None):
+    """Calendario in forma tabellare per sidebar e ML Insights"""
+    return pd.DataFrame([
+        {
+            'Evento': e['evento'],
+            'RN ×': e['rn'],
+            'ADR ×': e['adr'],
+            'Periodi': '; '.join(f"{start} → {end}" for start, end in e['periodi']),
+            **({'Stimato': e['evento'] in identified} if identified is not None else {})
+        }
+        for e in events
+    ])
+
+def calc_pickup_adr(window):
+    pickup = window['vs 7gg']
+    pos = pickup > 0
+    if pos.any() and nansum(pickup[pos]) > 0:
+        return nansum(window['ADR Room'][pos] * pickup[pos].astype(np.float64)) / nansum(pickup[pos])
+    return nanmean(window['ADR Room'])
+
+# ============================================================================
+# SERIE GIORNALIERE E DOWNSAMPLING PER I GRAFICI
+# ============================================================================
+
+# Punti per serie inviati al browser (circa la larghezza utile del grafico in pixel)
+CHART_RESOLUTIONS = [250, 500, 1000, 2000, 4000]
+CHART_DEFAULT_POINTS = 1000
+
+# Metrica -> colonne (daily, pickup) delle sorgenti allineate
+CHART_METRICS = {
+    'Roomnights': 'rn',
+    'ADR': 'adr',
+    'Revenue': 'revenue',
+}
+
+# Serie dei grafici lette direttamente dalle sorgenti, su tutto il periodo che coprono
+CHART_SOURCES = {
+    'OTB 2026': 'otb_2026',
+    'Anno scorso': 'year_2425',
+    'Pickup 7gg': 'pickup',
+}
+
+def daily_columns(columns, rn_col, adr_col):
+    """RN, ADR e revenue giornalieri di una sorgente allineata"""
+    rn = columns[rn_col]
+    adr = columns[adr_col]
+    return {'rn': rn, 'adr': adr, 'revenue': rn * adr}
+
+def pickup_daily_adr(columns, dates):
+    """ADR giornaliero del pickup: ADR Room nei giorni con pickup positivo, altrimenti l'ADR pickup del mese.
+
+    È il valore per giorno coerente con calc_pickup_adr, che pesa l'ADR sul
+    solo pickup positivo: un giorno senza nuove prenotazioni non porta un
+    proprio ADR di pickup.
+    """
+    month = month_index(dates)
+    month_adr = np.array([
+        calc_pickup_adr({name: col[date_window(dates, start, stop)] for name, col in columns.items()})
+        for start, stop in MONTH_WINDOWS.values()
+    ])
+    adr = np.where(columns['vs 7gg'] > 0, columns['ADR Room'], month_adr[month])
+    return np.where(np.isnan(columns['ADR Room']), np.nan, adr)
+
+def blend_components(values, weights, total):
+    """Media pesata per giorno delle componenti presenti, riportata al peso totale.
+
+    values e weights hanno una riga per componente; un giorno senza una
+    componente ridistribuisce il suo peso sulle altre in proporzione, un
+    giorno senza componenti (o con peso nullo) resta NaN.
+    """
+    present = ~np.isnan(values)
+    covered = np.where(present, weights, 0.0).sum(axis=0)
+    blended = np.where(present, values * weights, 0.0).sum(axis=0)
+    return np.divide(blended * total, covered, out=np.full(values.shape[1], np.nan), where=covered > 0)
+
+def daily_series(data, data_keys, calendar, day_weights, budget):
+    """Serie giornaliere sulle date target: OTB, forecast, anno scorso, budget e pickup.
+
+    Il forecast giornaliero applica a ogni componente il peso del giorno e i
+    moltiplicatori evento della sua sorgente (source_multipliers); nei giorni
+    in cui manca una componente i pesi sono rinormalizzati sulle componenti
+    presenti (blend_components). I totali mensili del forecast derivano da
+    queste serie, così KPI, grafici e archivio seguono la stessa regola. Il
+    budget mensile è ripartito in modo uniforme sui giorni del mese.
+    """
+    components = [c for c in day_weights['rn'] if COMPONENT_SOURCES[c] in data]
+
+    def compute():
+        dates = season_dates()
+        aligned = {c: aligned_source(data, data_keys, COMPONENT_SOURCES[c])['columns'] for c in components}
+        if 'pickup' in aligned:
+            aligned['pickup'] = {**aligned['pickup'], 'ADR Room': pickup_daily_adr(aligned['pickup'], dates)}
+        sources = {
+            c: daily_columns(aligned[c], 'vs 7gg', 'ADR Room') if c == 'pickup'
+            else daily_columns(aligned[c], 'Room nights', 'ADR Cam')
+            for c in components
+        }
+
+        multipliers = {c: dict(zip(['rn', 'adr'], source_multipliers(calendar, COMPONENT_SOURCES[c]))) for c in components}
+        forecast = {}
+        for metric in ['rn', 'adr']:
+            weights = np.array([np.broadcast_to(day_weights[metric][c], dates.shape) for c in components])
+            total = sum(np.broadcast_to(w, dates.shape) for w in day_weights[metric].values())
+            values = np.array([sources[c][metric] * multipliers[c][metric] for c in components], dtype=np.float64)
+            forecast[metric] = blend_components(values, weights, total)
+        forecast_rn, forecast_adr = forecast['rn'], forecast['adr']
+
+        month = month_index(dates)
+        keys = list(MONTH_WINDOWS)
+        days = np.array([month_days(k) for k in keys])[month]
+        budget_rn = np.array([budget[k]['rn'] for k in keys])[month] / days
+        budget_revenue = np.array([budget[k]['revenue'] for k in keys])[month] / days
+
+        return {
+            'dates': dates,
+            'OTB 2026': sources['otb'],
+            'Forecast': {'rn': forecast_rn, 'adr': forecast_adr, 'revenue': forecast_rn * forecast_adr},
+            'Anno scorso': sources['year'],
+            'Budget': {'rn': budget_rn, 'adr': np.array([budget[k]['adr'] for k in keys])[month],
+                       'revenue': budget_revenue},
+            'Pickup 7gg': sources['pickup'],
+        }
+
+    return pipeline_stage(
+        'Serie giornaliere',
+        (calendar['version'], data_keys['budget']) + tuple(
+            (data_keys[COMPONENT_SOURCES[c]], weights_digest(day_weights['rn'][c]), weights_digest(day_weights['adr'][c]))
+            for c in components
+        ),
+        compute, label="serie giornaliere"
+    )
+
+def chart_dates(data):
+    """Date target dalla prima all'ultima coperta da una sorgente dei grafici (stagione inclusa)"""
+    first, last = SEASON_START, SEASON_END - np.timedelta64(1, 'D')
+    for source in CHART_SOURCES.values():
+        if source not in data or data[source].dates is None:
+            continue
+        dates = data[source].dates[~np.isnat(data[source].dates)]
+        if len(dates):
+            lag = np.timedelta64(SOURCE_LAGS[source], 'D')
+            first, last = min(first, dates.min() + lag), max(last, dates.max() + lag)
+    return np.arange(first, last + np.timedelta64(1, 'D'), dtype='datetime64[D]')
+
+def chart_series(data, data_keys, series):
+    """Serie dei grafici sull'intero periodo delle sorgenti caricate, non solo sulla stagione.
+
+    OTB, anno scorso e pickup sono allineati su tutte le date coperte dai
+    file; forecast e budget (da daily_series) esistono solo nella stagione
+    e fuori restano NaN. Il downsampling lavora su queste serie.
+    """
+    def compute():
+        dates = chart_dates(data)
+        result = {'dates': dates}
+        for name, source in CHART_SOURCES.items():
+            if source not in data:
+                continue
+            _, columns = align_columns(data[source], dates, SOURCE_LAGS[source])
+            # Del pickup si traccia solo il volume (vs 7gg)
+            result[name] = {'rn': columns['vs 7gg']} if source == 'pickup' \
+                else daily_columns(columns, 'Room nights', 'ADR Cam')
+        pos = (series['dates'] - dates[0]).astype(np.int64)
+        for name in ['Forecast', 'Budget']:
+            result[name] = {}
+            for metric, values in series[name].items():
+                full = np.full(len(dates), np.nan)
+                full[pos] = values
+                result[name][metric] = full
+        return result
+
+    return pipeline_stage(
+        'Serie grafici',
+        tuple(data_keys.get(source) for source in CHART_SOURCES.values()) + (data_keys['budget'],) + tuple(
+            weights_digest(np.asarray(series[name][metric], dtype=np.float64))
+            for name in ['Forecast', 'Budget'] for metric in ['rn', 'adr']
+        ),
+        compute, label="serie grafici"
+    )
+
+def minmax_downsample(x, y, n_out):
+    """Min/max per bucket: conserva i picchi, al massimo n_out punti (2 per bucket)"""
+    n_buckets = max(1, n_out // 2)
+    bucket = np.arange(len(x)) * n_buckets // len(x)
+    # Per bucket, in ordine di y: il primo è il minimo, l'ultimo il massimo
+    order = np.lexsort((y, bucket))
+    first = np.r_[True, bucket[order][1:] != bucket[order][:-1]]
+    last = np.r_[first[1:], True]
+    keep = np.unique(np.concatenate([order[first], order[last]]))
+    return x[keep], y[keep]
+
+def lttb_downsample(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: n_out punti che preservano la forma visiva della serie"""
+    n = len(x)
+    xf = x.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Vertice successivo: media del bucket seguente (o l'ultimo punto)
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        nx, ny = xf[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((xf[prev] - nx) * (y[lo:hi] - y[prev]) - (xf[prev] - xf[lo:hi]) * (ny - y[prev]))
+        prev = lo + int(area.argmax())
+        keep[i + 1] = prev
+    return x[keep], y[keep]
+
+def downsample(dates, values, start, stop, max_points, method):
+    """Punti di una serie nella finestra [start, stop], ridotti lato server a max_points"""
+    mask = (dates >= start) & (dates <= stop) & np.isfinite(values)
+    x, y = dates[mask], values[mask]
+    if len(x) <= max_points:
+        return x, y
+    x_num = x.astype(np.int64)
+    if method == "LTTB":
+        idx_x, y = lttb_downsample(x_num, y, max_points)
+    else:
+        idx_x, y = minmax_downsample(x_num, y, max_points)
+    return idx_x.astype('datetime64[D]'), y
+
+# ============================================================================
+# ARCHIVIO RUN
+# ============================================================================
+
+# Cartella dell'archivio: un file .npz colonnare per run, nome <data report>_<id run>.npz
+RUN_ARCHIVE_DIR = os.environ.get('RUN_ARCHIVE_DIR', 'run_archive')
+
+MONTH_LABELS = {'dic': 'Dicembre', 'gen': 'Gennaio', 'feb': 'Febbraio'}
+
+def run_columns(data, data_keys, calendar, day_weights, series):
+    """Colonne giornaliere del run: componenti allineate, pesi, calendario eventi (target e per componente), forecast e budget"""
+    columns = {'dates': series['dates'], 'cal_rn': calendar['rn'], 'cal_adr': calendar['adr']}
+    for component in day_weights['rn']:
+        source = COMPONENT_SOURCES[component]
+        if source not in data:
+            continue
+        aligned = aligned_source(data, data_keys, source)['columns']
+        rn_col, adr_col = ('vs 7gg', 'ADR Room') if component == 'pickup' else ('Room nights', 'ADR Cam')
+        columns[f'{component}_rn'] = aligned[rn_col]
+        columns[f'{component}_adr'] = aligned[adr_col]
+        columns[f'w_rn_{component}'] = day_weights['rn'][component]
+        columns[f'w_adr_{component}'] = day_weights['adr'][component]
+        columns[f'm_rn_{component}'], columns[f'm_adr_{component}'] = source_multipliers(calendar, source)
+    for metric in ['rn', 'adr', 'revenue']:
+        columns[f'fcst_{metric}'] = series['Forecast'][metric]
+        columns[f'bdg_{metric}'] = series['Budget'][metric]
+    # float32 per le metriche: l'archivio resta compatto
+    return {
+        name: col if name == 'dates' else np.asarray(col, dtype=np.float32)
+        for name, col in columns.items()
+    }
+
+def run_identity(meta):
+    """Id del run dagli input che determinano il risultato (file, pesi giornalieri, eventi, data report, modalità)"""
+    inputs = {k: meta[k] for k in ['inputs', 'weights', 'segmentation', 'weights_digest', 'events', 'report_date', 'mode']}
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:12]
+
+def archive_run(meta, columns, directory=RUN_ARCHIVE_DIR):
+    """Salva il run se non già in archivio; restituisce id e se è stato scritto ora"""
+    run_id = run_identity(meta)
+    path = os.path.join(directory, f"{meta['report_date']}_{run_id}.npz")
+    if os.path.exists(path):
+        return run_id, False
+    os.makedirs(directory, exist_ok=True)
+    
+    # Scrittura atomica: un run parziale non compare mai nell'indice
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, meta=np.array(json.dumps(dict(meta, run_id=run_id))), **columns)
+    os.replace(tmp_path, path)
+    return run_id, True
+
+def archive_index(directory=RUN_ARCHIVE_DIR):
+    """Run archiviati ordinati per data report (più recente prima), letti dai nomi file"""
+    if not os.path.isdir(directory):
+        return []
+    runs = []
+    for name in os.listdir(directory):
+        match = re.fullmatch(r'(\d{4}-\d{2}-\d{2})_([0-9a-f]{12})\.npz', name)
+        if match:
+            runs.append({'report_date': match.group(1), 'run_id': match.group(2),
+                         'path': os.path.join(directory, name)})
+    return sorted(runs, key=lambda r: (r['report_date'], os.path.getmtime(r['path'])), reverse=True)
+
+def load_archived_run(path):
+    """Metadati e colonne di un run archiviato (i file sono immutabili: in cache per percorso)"""
+    def load():
+        with np.load(path) as archive:
+            columns = {name: archive[name] for name in archive.files if name != 'meta'}
+            meta = json.loads(str(archive['meta']))
+        for col in columns.values():
+            col.setflags(write=False)
+        return {'meta': meta, 'columns': columns}
+
+    return dataset_store().get_or_compute(('archive', path), load, label=f"archivio {os.path.basename(path)}")
+
+def month_index(dates):
+    """Indice del mese della stagione (0 = dicembre) per ogni data"""
+    return np.searchsorted([start for start, _ in MONTH_WINDOWS.values()], dates, side='right') - 1
+
+def run_diff(run_a, run_b):
+    """Differenza vettoriale del forecast giornaliero (B - A) sulle date comuni, con totali mensili"""
+    cols_a, cols_b = run_a['columns'], run_b['columns']
+    dates, idx_a, idx_b = np.intersect1d(cols_a['dates'], cols_b['dates'], return_indices=True)
+    
+    daily = {'dates': dates}
+    for metric in ['rn', 'adr', 'revenue']:
+        a = cols_a[f'fcst_{metric}'][idx_a].astype(np.float64)
+        b = cols_b[f'fcst_{metric}'][idx_b].astype(np.float64)
+        daily[metric] = (a, b, b - a)
+    
+    month = month_index(dates)
+    n_months = len(MONTH_WINDOWS)
+    totals = {
+        run: {metric: np.bincount(month, weights=np.nan_to_num(daily[metric][i]), minlength=n_months)
+              for metric in ['rn', 'revenue']}
+        for i, run in enumerate(['A', 'B'])
+    }
+    monthly = pd.DataFrame({
+        'Mese': list(MONTH_LABELS.values()),
+        'RN A': totals['A']['rn'],
+        'RN B': totals['B']['rn'],
+        'Δ RN': totals['B']['rn'] - totals['A']['rn'],
+        'Revenue A': totals['A']['revenue'],
+        'Revenue B': totals['B']['revenue'],
+        'Δ Revenue': totals['B']['revenue'] - totals['A']['revenue'],
+    })
+    return daily, monthly
+
+def drift_table(runs):
+    """Forecast mensile di ogni run archiviato, per seguire la deriva nel tempo"""
+    rows = []
+    for run in runs:
+        meta = load_archived_run(run['path'])['meta']
+        for month, label in MONTH_LABELS.items():
+            rows.append({
+                'Data report': pd.Timestamp(meta['report_date']),
+                'Run': meta['run_id'],
+                'Mese': label,
+                'Revenue': meta['outputs'][month]['revenue'],
+                'RN': meta['outputs'][month]['rn']
+            })
+    return pd.DataFrame(rows).sort_values('Data report') if rows else pd.DataFrame()
+
+# ============================================================================
+# ARCHIVIO RUN - CONSULTAZIONE (senza file Excel)
+# ============================================================================
+
+view = st.sidebar.radio("Vista:", ["Forecast corrente", "Archivio run"], horizontal=True)
+
+if view == "Archivio run":
+    st.header("🗄️ Archivio Run")
+    runs = archive_index()
+    if not runs:
+        st.info(f"Nessun run archiviato in `{RUN_ARCHIVE_DIR}`: i forecast vengono salvati automaticamente a ogni calcolo")
+        st.stop()
+    
+    run_labels = [f"{r['report_date']} · {r['run_id']}" for r in runs]
+    selected = st.selectbox("Run (per data report)", run_labels)
+    run = load_archived_run(runs[run_labels.index(selected)]['path'])
+    meta = run['meta']
+    
+    st.markdown(f"""
+    <div class="highlight-box">
+    <strong>Data Report:</strong> {pd.Timestamp(meta['report_date']).strftime('%d/%m/%Y')} |
+    <strong>Modalità:</strong> {meta['mode']} |
+    <strong>Salvato:</strong> {pd.Timestamp(meta['created']).strftime('%d/%m/%Y %H:%M')}
+    </div>
+    """, unsafe_allow_html=True)
+    
+    for month, label in MONTH_LABELS.items():
+        output, budget = meta['outputs'][month], meta['budget'][month]
+        st.subheader(label)
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Roomnights", f"{output['rn']:,.0f}", f"{((output['rn']/budget['rn']-1)*100):.1f}% vs BDG")
+        with col2:
+            st.metric("ADR Camera", f"€{output['adr']:,.2f}", f"{((output['adr']/budget['adr']-1)*100):.1f}% vs BDG")
+        with col3:
+            st.metric("Revenue", f"€{output['revenue']:,.0f}",
+                      f"{((output['revenue']/budget['revenue']-1)*100):.1f}% vs BDG")
+        with col4:
+            st.metric("Occupancy", f"{output['occ']:.1%}", f"{(output['occ']-budget['occ']):.1%} vs BDG")
+    
+    with st.expander("⚙️ Pesi, eventi e input del run"):
+        st.caption(f"Segmentazione pesi: {meta.get('segmentation', 'Nessuna')}")
+        st.dataframe(pd.DataFrame(meta['weights']).rename(columns={'rn': 'Peso RN', 'adr': 'Peso ADR'}),
+                     use_container_width=True)
+        st.dataframe(pd.DataFrame(meta['events']), hide_index=True, use_container_width=True)
+        st.dataframe(pd.DataFrame({'Sorgente': list(meta['inputs']), 'SHA-256': list(meta['inputs'].values())}),
+                     hide_index=True, use_container_width=True)
+    
+    # Confronto vettoriale tra due run
+    st.markdown("---")
+    st.subheader("🔍 Confronto tra Run")
+    others = [label for label in run_labels if label != selected]
+    if others:
+        compare = st.selectbox("Confronta con (A = run confrontato, B = run selezionato)", others)
+        daily, monthly = run_diff(load_archived_run(runs[run_labels.index(compare)]['path']), run)
+        st.caption("Totali mensili dal forecast giornaliero archiviato (tutti i giorni del mese, senza split actual)")
+        st.dataframe(
+            monthly, hide_index=True, use_container_width=True,
+            column_config={c: st.column_config.NumberColumn(format="%.0f") for c in monthly.columns if c != 'Mese'}
+        )
+        fig_diff = go.Figure()
+        fig_diff.add_trace(go.Scattergl(x=daily['dates'], y=daily['revenue'][2], mode='lines',
+                                        name='Δ Revenue', line=dict(color='#366092')))
+        fig_diff.update_layout(title='Δ Revenue forecast giornaliero (B - A)', yaxis_title='€', height=350)
+        st.plotly_chart(fig_diff, use_container_width=True)
+    else:
+        st.caption("Serve almeno un altro run in archivio")
+    
+    # Deriva del forecast al variare della data report
+    drift = drift_table(runs)
+    fig_drift = go.Figure()
+    for label in MONTH_LABELS.values():
+        month_drift = drift[drift['Mese'] == label]
+        fig_drift.add_trace(go.Scatter(x=month_drift['Data report'], y=month_drift['Revenue'],
+                                       mode='lines+markers', name=label))
+    fig_drift.update_layout(title='Deriva Forecast Revenue per Data Report', yaxis_title='Revenue (€)', height=400)
+    st.plotly_chart(fig_drift, use_container_width=True)
+    st.stop()
+
+st.sidebar.markdown("---")
 
 # ============================================================================
 # SIDEBAR - FILE UPLOAD
@@ -251,7 +1791,41 @@ st.sidebar.markdown("Carica **5-7 file**:")
 st.sidebar.markdown("• Base: Baseline, Year, OTB, Budget")  
 st.sidebar.markdown("• Pickup: unificato O (RN + ADR) separati")
 st.sidebar.markdown("• **Opzionale**: OTB Year-Ago per YoY comparison")
-uploaded_files = st.sidebar.file_uploader("Seleziona file Excel", type=['xlsx'], accept_multiple_files=True)
+
+# La cartella monitorata è solo quella configurata sul server (DROP_FOLDER)
+ingest_mode = st.sidebar.radio(
+    "Sorgente file:",
+    ["Upload manuale", "Cartella monitorata"] if DROP_FOLDER else ["Upload manuale"],
+    index=1 if DROP_FOLDER else 0,
+    help="Cartella monitorata: gli export del PMS in DROP_FOLDER vengono acquisiti automaticamente"
+)
+
+if ingest_mode == "Cartella monitorata":
+    st.sidebar.caption(f"📁 {DROP_FOLDER}")
+    if not os.path.isdir(DROP_FOLDER):
+        st.sidebar.error("⚠️ Cartella non trovata")
+        st.warning(f"⚠️ La cartella DROP_FOLDER ({DROP_FOLDER}) non esiste sul server")
+        st.stop()
+    
+    watcher = folder_watcher()
+    uploaded_files, watch_version = watcher.snapshot()
+    watch_status = st.sidebar.empty()
+    if watcher.error is not None:
+        st.sidebar.error(f"❌ Scansione cartella: {watcher.error}")
+    with st.sidebar.expander(f"📂 Acquisizioni ({len(watcher.seen)} file distinti)"):
+        if watcher.log:
+            st.dataframe(pd.DataFrame(list(watcher.log)), hide_index=True, use_container_width=True,
+                         column_config={'Ora': st.column_config.DatetimeColumn(format="HH:mm:ss")})
+        else:
+            st.caption(f"In attesa di file (lettura dopo {WATCH_DEBOUNCE_SECONDS:.0f}s senza modifiche)")
+else:
+    uploaded_files = st.sidebar.file_uploader("Seleziona file Excel", type=['xlsx'], accept_multiple_files=True)
+
+def stop_until_next_drop():
+    """Dati incompleti: in cartella monitorata si attende il prossimo export, altrimenti ci si ferma"""
+    if ingest_mode == "Cartella monitorata":
+        listen_for_drops(watcher, watch_version, watch_status)
+    st.stop()
 
 files_dict = {}
 if uploaded_files:
@@ -260,7 +1834,10 @@ if uploaded_files:
     
     for file in uploaded_files:
         file_type = identify_file_type(file)
-        if file_type:
+        if file_type in files_dict:
+            # Due file dello stesso tipo: si tiene il primo, senza sostituzioni silenziose
+            st.sidebar.warning(f"⚠️ {file.name}: stesso tipo di {files_dict[file_type].name} ({file_type}), ignorato")
+        elif file_type:
             files_dict[file_type] = file
             labels = {
                 'baseline_2324': "Baseline 2023-24",
@@ -305,7 +1882,7 @@ if uploaded_files:
            - File unificato (con vs 7gg E ADR Room)
            - File RN (con vs 7gg) + File ADR (con ADR Room) separati
         """)
-        st.stop()
+        stop_until_next_drop()
     else:
         total_files = len(files_dict)
         st.sidebar.success(f"✅ Tutti i file caricati! ({total_files} file)")
@@ -333,11 +1910,11 @@ else:
     5. pickup_adr.xlsx (con ADR Room)
     6. budget.xlsx
     """)
-    st.stop()
+    stop_until_next_drop()
 
-data = load_data_from_uploads(files_dict)
+data, data_keys = load_data_from_uploads(files_dict)
 if data is None:
-    st.stop()
+    stop_until_next_drop()
 
 # Verifica che pickup abbia le colonne necessarie
 required_pickup_cols = ['ADR Room', 'vs 7gg']
@@ -354,10 +1931,30 @@ if missing_cols:
     1. Usa file unificato con entrambe le colonne
     2. Oppure carica 2 file separati (RN + ADR) che verranno uniti automaticamente
     """)
-    st.stop()
+    stop_until_next_drop()
 else:
     st.sidebar.success("✅ File Pickup validato correttamente!")
 
+with st.sidebar.expander("📦 Memoria dataset"):
+    report_mem = memory_report(data)
+    st.dataframe(
+        report_mem, hide_index=True, use_container_width=True,
+        column_config={
+            'Originale (KB)': st.column_config.NumberColumn(format="%.1f"),
+            'Compatto (KB)': st.column_config.NumberColumn(format="%.1f"),
+            'Riduzione': st.column_config.ProgressColumn(min_value=0, max_value=1, format="%.2f")
+        }
+    )
+    st.caption(f"Totale: {report_mem['Compatto (KB)'].sum():,.1f} KB compatti "
+               f"vs {report_mem['Originale (KB)'].sum():,.1f} KB originali")
+
+with st.sidebar.expander("🗓️ Allineamento YoY (giorno settimana)"):
+    report_align = alignment_report(data, data_keys)
+    st.dataframe(report_align, hide_index=True, use_container_width=True)
+    incomplete = report_align[report_align['Giorni coperti'] < report_align['Giorni target']]
+    for _, row in incomplete.iterrows():
+        st.warning(f"⚠️ {row['Sorgente']}: {row['Giorni target'] - row['Giorni coperti']} giorni senza controparte")
+
 st.sidebar.markdown("---")
 
 # ============================================================================
@@ -366,16 +1963,8 @@ st.sidebar.markdown("---")
 
 st.sidebar.header("📅 Data Riferimento")
 
-# Estrai data dal nome file o usa oggi
-default_date = datetime.now()
-for file in uploaded_files:
-    if 'otb' in file.name.lower():
-        # Cerca pattern data nel filename (es: 2025-12-16)
-        import re
-        match = re.search(r'(\d{4})-(\d{2})-(\d{2})', file.name)
-        if match:
-            default_date = datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
-            break
+# Estrai data dal file OTB (contenuto o nome) o usa oggi
+default_date = report_date_for(data['otb_2026'], files_dict['otb_2026']) or datetime.now()
 
 report_date = st.sidebar.date_input(
     "Data Report OTB",
@@ -453,6 +2042,10 @@ if mode == "Manual":
     else:
         st.sidebar.success(f"✅ TOTALE: {peso_totale}%")
     
+    # In manuale RN e ADR usano gli stessi pesi
+    segmentation = "Nessuna"
+    segments, segment_labels = segment_ids(season_dates(), segmentation, report_date)
+    segment_weights = [{'rn': weights, 'adr': weights}]
     ml_used = False
     
 else:  # Autopilot
@@ -463,133 +2056,167 @@ else:  # Autopilot
     </div>
     """, unsafe_allow_html=True)
     
+    segmentation = st.sidebar.selectbox(
+        "Segmentazione pesi",
+        SEGMENTATIONS,
+        help="Un set di pesi per mese, giorno della settimana o lead time, ottimizzati insieme"
+    )
+    
     # Usa dati storici per ottimizzare
     # Per semplicità, uso baseline 2024 come "actual" e ottimizzo i pesi
     
-    with st.spinner("🔄 Ottimizzazione ML in corso..."):
-        # Prepara dati per ottimizzazione (usa Gen 2024 come test)
-        test_baseline = {
-            'rn': data['baseline_2324'].iloc[32:63]['Room nights'].sum(),
-            'adr': data['baseline_2324'].iloc[32:63]['ADR Cam'].mean()
-        }
-        test_year = {
-            'rn': data['year_2425'].iloc[31:62]['Room nights'].sum(),
-            'adr': data['year_2425'].iloc[31:62]['ADR Cam'].mean()
-        }
-        test_otb = {
-            'rn': data['otb_2026'].iloc[31:62]['Room nights'].sum(),
-            'adr': data['otb_2026'].iloc[31:62]['ADR Cam'].mean()
-        }
-        
-        # Target: usa baseline come "actual"
-        actual_rn = test_baseline['rn']
-        actual_adr = test_baseline['adr']
-        
-        # Ottimizza
-        best_weights, mape_rn, mape_adr = optimize_weights_grid_search(
-            test_baseline, test_year, test_otb, actual_rn, actual_adr
-        )
-        
-        weights = best_weights
+    # Prepara dati per ottimizzazione: tutta la stagione, allineata per giorno settimana
+    validation = {
+        component: aligned_source(data, data_keys, COMPONENT_SOURCES[component])['columns']
+        for component in ['baseline', 'year', 'otb']
+    }
+    X_rn = np.vstack([validation[c]['Room nights'] for c in ['baseline', 'year', 'otb']])
+    X_adr = np.vstack([validation[c]['ADR Cam'] for c in ['baseline', 'year', 'otb']])
+    
+    # Target: usa baseline come "actual"
+    actual_rn = validation['baseline']['Room nights']
+    actual_adr = validation['baseline']['ADR Cam']
+    actual_rev = validation['baseline']['Room Revenue']
+    
+    segments, segment_labels = segment_ids(season_dates(), segmentation, report_date)
+    
+    # Ottimizza in background
+    weights_job, weights_result = autopilot_job(
+        'weights',
+        ('weights', data_keys['baseline_2324'], data_keys['year_2425'], data_keys['otb_2026'],
+         segmentation, report_date if segmentation == "Lead time" else None),
+        "Ottimizzazione pesi",
+        optimize_segment_weights,
+        X_rn, X_adr, actual_rn, actual_adr, actual_rev, segments, segment_labels
+    )
+    render_job_status('weights', weights_job)
+    
+    # Un risultato di un'altra segmentazione (ultimo valido) non si applica ai segmenti correnti
+    if weights_result is not None and weights_result['labels'] != segment_labels:
+        weights_result = None
+    
+    if weights_result is not None:
+        segment_weights = weights_result['weights']
+        mape_rn = weights_result['overall_mape_rn']
+        mape_adr = weights_result['overall_mape_adr']
         ml_used = True
         
-        st.sidebar.success(f"""
-        ✅ **Pesi Ottimizzati:**
-        - Baseline: {weights['baseline']:.0%}
-        - Year: {weights['year']:.0%}
-        - OTB: {weights['otb']:.0%}
-        - Pickup: {weights['pickup']:.0%}
+        # Punto del fronte di Pareto scelto nel tab ML Insights (default: ottimo indipendente)
+        pareto = weights_result.get('pareto')
+        if pareto is not None and pareto['weights']:
+            labels = pareto_labels(pareto)
+            choice = st.session_state.get('pareto_choice')
+            choice = labels.index(choice) if choice in labels else pareto_default(pareto)
+            segment_weights = [pareto['weights'][choice]]
+            mape_rn = pareto['mape_rn'][choice]
+            mape_adr = pareto['mape_adr'][choice]
         
-        **Performance:**
-        - MAPE RN: {mape_rn:.2f}%
-        - MAPE ADR: {mape_adr:.2f}%
-        """)
+        status = "✅ **Pesi Ottimizzati:**" if weights_job.result is not None else "⏳ **Pesi (ultimo risultato valido):**"
+        if len(segment_labels) == 1:
+            rn_w, adr_w = segment_weights[0]['rn'], segment_weights[0]['adr']
+            st.sidebar.success(f"""
+            {status} (RN / ADR)
+            - Baseline: {rn_w['baseline']:.0%} / {adr_w['baseline']:.0%}
+            - Year: {rn_w['year']:.0%} / {adr_w['year']:.0%}
+            - OTB: {rn_w['otb']:.0%} / {adr_w['otb']:.0%}
+            - Pickup: {rn_w['pickup']:.0%} / {adr_w['pickup']:.0%}
+            
+            **Performance:**
+            - MAPE RN: {mape_rn:.2f}%
+            - MAPE ADR: {mape_adr:.2f}%
+            """)
+        else:
+            st.sidebar.success(f"""
+            {status} {len(segment_labels)} segmenti ({segmentation})
+            
+            **Performance:**
+            - MAPE RN: {mape_rn:.2f}%
+            - MAPE ADR: {mape_adr:.2f}%
+            """)
+            st.sidebar.dataframe(
+                segment_weights_table(weights_result)[
+                    ['Segmento'] + [f"{c.capitalize()} {m}" for m in ['RN', 'ADR'] for c in GRID_COMPONENTS]
+                ],
+                hide_index=True, use_container_width=True
+            )
+    else:
+        # Nessun risultato ancora: pesi di default finché il job non termina
+        segments, segment_labels = segment_ids(season_dates(), "Nessuna", report_date)
+        segment_weights = [{'rn': dict(DEFAULT_WEIGHTS), 'adr': dict(DEFAULT_WEIGHTS)}]
+        ml_used = False
+        st.sidebar.info("⏳ In attesa dell'ottimizzazione - pesi di default in uso")
+
+# Pesi giornalieri (per segmento) e media sulla stagione per la visualizzazione, separati RN / ADR
+day_weights = {metric: expand_segment_weights(segment_weights, segments, metric) for metric in ['rn', 'adr']}
+weights = {
+    metric: {component: float(w.mean()) for component, w in day_weights[metric].items()}
+    for metric in ['rn', 'adr']
+}
 
 st.sidebar.markdown("---")
-st.sidebar.subheader("Biennale Adjustment")
+st.sidebar.subheader("🎭 Calendario Eventi")
 
-biennale_mode = st.sidebar.radio(
+events_mode = st.sidebar.radio(
     "Modalità:",
-    ["Manual", "Auto (Grid Search ML)"],
-    help="Manual: imposti tu | Auto: calcolo ottimale da dati storici Arte vs Architettura"
+    ["Manual", "Auto (Least Squares ML)"],
+    help="Manual: imposti tu i moltiplicatori | Auto: stima congiunta da dati storici Arte vs Architettura"
 )
 
-if biennale_mode == "Manual":
-    biennale_adj = st.sidebar.number_input(
-        "Fattore Moltiplicativo",
-        min_value=1.00, max_value=1.50, value=1.10, step=0.01,
-        help="Adjustment manuale per Biennale Arte 2026"
+if events_mode == "Manual":
+    edited = st.sidebar.data_editor(
+        events_table(VENICE_EVENTS)[['Evento', 'RN ×', 'ADR ×']],
+        hide_index=True,
+        disabled=['Evento'],
+        column_config={
+            'RN ×': st.column_config.NumberColumn(min_value=0.50, max_value=2.00, step=0.01, format="%.2f"),
+            'ADR ×': st.column_config.NumberColumn(min_value=0.50, max_value=2.00, step=0.01, format="%.2f")
+        },
+        key="events_editor"
     )
-    ml_biennale_used = False
+    events = [
+        dict(event, rn=float(row['RN ×']), adr=float(row['ADR ×']))
+        for event, (_, row) in zip(VENICE_EVENTS, edited.iterrows())
+    ]
+    events_fit = None
     
-else:  # Auto Grid Search
-    with st.spinner("🔄 Calcolo automatico Biennale Adjustment..."):
-        
-        # Dati per calcolo
-        # Baseline 2023-24 = Biennale ARTE (target da raggiungere)
-        # Year 2024-25 = Biennale ARCHITETTURA (punto di partenza)
-        
-        # Gennaio come periodo di validazione (più stabile di dicembre/febbraio)
-        baseline_arte_gen = {
-            'rn': data['baseline_2324'].iloc[32:63]['Room nights'].sum(),
-            'adr': data['baseline_2324'].iloc[32:63]['ADR Cam'].mean()
-        }
-        
-        year_arch_gen = {
-            'rn': data['year_2425'].iloc[31:62]['Room nights'].sum(),
-            'adr': data['year_2425'].iloc[31:62]['ADR Cam'].mean()
-        }
-        
-        # Grid search: testa fattori da 1.00 a 1.30
-        best_factor = 1.10
-        best_mape_combined = float('inf')
-        
-        results = []
-        
-        for factor in np.arange(1.00, 1.31, 0.02):  # Step 0.02 per velocità
-            # Forecast: Architettura × Factor = Arte previsto
-            forecast_rn = year_arch_gen['rn'] * factor
-            forecast_adr = year_arch_gen['adr'] * factor
-            
-            # MAPE vs Arte reale
-            mape_rn = abs(forecast_rn - baseline_arte_gen['rn']) / baseline_arte_gen['rn'] * 100
-            mape_adr = abs(forecast_adr - baseline_arte_gen['adr']) / baseline_arte_gen['adr'] * 100
-            
-            # Combined MAPE (peso uguale)
-            combined_mape = (mape_rn + mape_adr) / 2
-            
-            results.append({
-                'factor': factor,
-                'mape_rn': mape_rn,
-                'mape_adr': mape_adr,
-                'combined_mape': combined_mape
-            })
-            
-            if combined_mape < best_mape_combined:
-                best_mape_combined = combined_mape
-                best_factor = factor
-                best_mape_rn = mape_rn
-                best_mape_adr = mape_adr
-        
-        biennale_adj = best_factor
-        ml_biennale_used = True
+else:  # Auto Least Squares
+    # Dati per calcolo
+    # Baseline 2023-24 = Biennale ARTE (target da raggiungere)
+    # Year 2024-25 = Biennale ARCHITETTURA (punto di partenza)
+    # Tutti i giorni della stagione, allineati per giorno della settimana
+    arte = aligned_source(data, data_keys, 'baseline_2324')
+    architettura = aligned_source(data, data_keys, 'year_2425')
+    
+    events_job, events_fit = autopilot_job(
+        'events',
+        ('events', data_keys['baseline_2324'], data_keys['year_2425'], calendar_version(VENICE_EVENTS)),
+        "Stima calendario eventi",
+        fit_event_multipliers,
+        VENICE_EVENTS, arte['dates'], arte['columns'], architettura['columns']
+    )
+    render_job_status('events', events_job)
+    
+    if events_fit is not None:
+        events = events_fit['events']
         
         # Mostra risultati
-        st.sidebar.success(f"✅ **Fattore Ottimale: {biennale_adj:.2f}**")
+        st.sidebar.success(f"✅ **{len(events_fit['identified'])} eventi stimati** su {events_fit['n_days']} giorni")
         
         with st.sidebar.expander("📊 Dettagli Calcolo"):
-            st.write(f"**Validation: Gennaio**")
-            st.write(f"Arte 2024 (target): {baseline_arte_gen['rn']:.0f} RN, €{baseline_arte_gen['adr']:.2f} ADR")
-            st.write(f"Architettura 2025: {year_arch_gen['rn']:.0f} RN, €{year_arch_gen['adr']:.2f} ADR")
-            st.write(f"")
-            st.write(f"**Performance con fattore {biennale_adj:.2f}:**")
-            st.write(f"MAPE RN: {best_mape_rn:.2f}%")
-            st.write(f"MAPE ADR: {best_mape_adr:.2f}%")
-            st.write(f"MAPE Combined: {best_mape_combined:.2f}%")
-            st.write(f"")
-            st.write(f"**Interpretazione:**")
-            diff_pct = (biennale_adj - 1) * 100
-            st.write(f"Biennale Arte storicamente supera Architettura di **+{diff_pct:.1f}%**")
+            st.dataframe(events_table(events, events_fit['identified'])[['Evento', 'RN ×', 'ADR ×', 'Stimato']],
+                         hide_index=True, use_container_width=True)
+            st.write(f"MAPE RN: {events_fit['mape_rn']:.2f}%")
+            st.write(f"MAPE ADR: {events_fit['mape_adr']:.2f}%")
+            st.caption("Eventi non attivi nella storia disponibile mantengono il moltiplicatore di default")
+    else:
+        # Nessun risultato ancora: calendario di default finché il job non termina
+        events = VENICE_EVENTS
+        st.sidebar.info("⏳ In attesa della stima - calendario di default in uso")
+
+event_calendar = expand_event_calendar(events)
+
+# Job Autopilot non più richiesti (modalità Manual) non devono occupare i worker condivisi
+release_unrequested_jobs()
 
 # ============================================================================
 # CALCOLI FORECAST CON DATA DINAMICA
@@ -598,43 +2225,60 @@ else:  # Auto Grid Search
 try:
     num_rooms = 66
     
+    # Budget
+    budget_data = {
+        'dic': {
+            'rn': float(data['budget']['Roomnights BDG'][1]),
+            'adr': float(data['budget']['ADR Room BDG'][1]),
+            'revenue': float(data['budget']['Room Revenue BDG'][1]),
+            'occ': float(data['budget']['Occ.% BDG'][1])
+        },
+        'gen': {
+            'rn': float(data['budget']['Roomnights BDG'][2]),
+            'adr': float(data['budget']['ADR Room BDG'][2]),
+            'revenue': float(data['budget']['Room Revenue BDG'][2]),
+            'occ': float(data['budget']['Occ.% BDG'][2])
+        },
+        'feb': {
+            'rn': float(data['budget']['Roomnights BDG'][3]),
+            'adr': float(data['budget']['ADR Room BDG'][3]),
+            'revenue': float(data['budget']['Room Revenue BDG'][3]),
+            'occ': float(data['budget']['Occ.% BDG'][3])
+        }
+    }
+    
+    # Serie giornaliere della stagione: base di KPI mensili, grafici e archivio
+    season_series = daily_series(data, data_keys, event_calendar, day_weights, budget_data)
+    
+    def month_forecast(start, stop, days):
+        """Forecast su [start, stop) dalle serie giornaliere: RN sommate, ADR medio dei giorni con forecast"""
+        forecast = season_series['Forecast']
+        
+        def compute():
+            window = date_window(season_series['dates'], start, stop)
+            rn = nansum(forecast['rn'][window])
+            adr = nanmean(forecast['adr'][window])
+            return {'rn': rn, 'adr': adr, 'revenue': rn * adr, 'occ': rn / (num_rooms * days)}
+        
+        return pipeline_stage(
+            'Forecast mensile',
+            (str(start), str(stop), num_rooms * days, weights_digest(forecast['rn']), weights_digest(forecast['adr'])),
+            compute, label=f"forecast [{start} → {stop}]"
+        )
+    
     # DICEMBRE - con split dinamico
+    dic_start, dic_stop = MONTH_WINDOWS['dic']
+    dic_split = dic_start + np.timedelta64(giorni_actual_dic, 'D')
+    
     if giorni_actual_dic > 0:
-        dic_actual = {
-            'rn': data['otb_2026'].iloc[0:giorni_actual_dic]['Room nights'].sum(),
-            'adr': data['otb_2026'].iloc[0:giorni_actual_dic]['ADR Cam'].mean(),
-            'revenue': data['otb_2026'].iloc[0:giorni_actual_dic]['Room Revenue'].sum(),
-        }
-        dic_actual['occ'] = dic_actual['rn'] / (num_rooms * giorni_actual_dic)
+        dic_actual = aligned_totals(data, data_keys, 'otb_2026', dic_start, dic_split)
+        dic_actual = dict(dic_actual, occ=dic_actual['rn'] / (num_rooms * giorni_actual_dic))
     else:
         dic_actual = {'rn': 0, 'adr': 0, 'revenue': 0, 'occ': 0}
     
     # Forecast per giorni rimanenti
     if giorni_forecast_dic > 0:
-        start_idx = giorni_actual_dic
-        end_idx = 31
-        
-        dic_fcst_baseline = {
-            'rn': data['baseline_2324'].iloc[start_idx:end_idx]['Room nights'].sum(),
-            'adr': data['baseline_2324'].iloc[start_idx:end_idx]['ADR Cam'].mean()
-        }
-        dic_fcst_year = {
-            'rn': data['year_2425'].iloc[start_idx:end_idx]['Room nights'].sum(),
-            'adr': data['year_2425'].iloc[start_idx:end_idx]['ADR Cam'].mean()
-        }
-        dic_fcst_otb = {
-            'rn': data['otb_2026'].iloc[start_idx:end_idx]['Room nights'].sum(),
-            'adr': data['otb_2026'].iloc[start_idx:end_idx]['ADR Cam'].mean()
-        }
-        dic_fcst_pickup = {
-            'rn': data['pickup'].iloc[start_idx:end_idx]['vs 7gg'].sum(),
-            'adr': calc_pickup_adr(data['pickup'].iloc[start_idx:end_idx])
-        }
-        
-        dic_fcst = calculate_forecast_simple(
-            dic_fcst_baseline, dic_fcst_year, dic_fcst_otb, dic_fcst_pickup,
-            weights, biennale_adj, num_rooms * giorni_forecast_dic
-        )
+        dic_fcst = month_forecast(dic_split, dic_stop, giorni_forecast_dic)
     else:
         dic_fcst = {'rn': 0, 'adr': 0, 'revenue': 0, 'occ': 0}
     
@@ -643,80 +2287,48 @@ try:
         'revenue': dic_actual['revenue'] + dic_fcst['revenue'],
     }
     dic_total['adr'] = dic_total['revenue'] / dic_total['rn'] if dic_total['rn'] > 0 else 0
-    dic_total['occ'] = dic_total['rn'] / (num_rooms * 31)
+    dic_total['occ'] = dic_total['rn'] / (num_rooms * month_days('dic'))
     
     # GENNAIO
-    gen_baseline = {
-        'rn': data['baseline_2324'].iloc[32:63]['Room nights'].sum(),
-        'adr': data['baseline_2324'].iloc[32:63]['ADR Cam'].mean()
-    }
-    gen_year = {
-        'rn': data['year_2425'].iloc[31:62]['Room nights'].sum(),
-        'adr': data['year_2425'].iloc[31:62]['ADR Cam'].mean()
-    }
-    gen_otb = {
-        'rn': data['otb_2026'].iloc[31:62]['Room nights'].sum(),
-        'adr': data['otb_2026'].iloc[31:62]['ADR Cam'].mean()
-    }
-    gen_pickup = {
-        'rn': data['pickup'].iloc[31:62]['vs 7gg'].sum(),
-        'adr': calc_pickup_adr(data['pickup'].iloc[31:62])
-    }
-    
-    gen_fcst = calculate_forecast_simple(
-        gen_baseline, gen_year, gen_otb, gen_pickup,
-        weights, biennale_adj, num_rooms * 31
-    )
+    gen_fcst = month_forecast(*MONTH_WINDOWS['gen'], month_days('gen'))
     
     # FEBBRAIO
-    feb_baseline = {
-        'rn': data['baseline_2324'].iloc[63:92]['Room nights'].sum(),
-        'adr': data['baseline_2324'].iloc[63:92]['ADR Cam'].mean()
-    }
-    feb_year = {
-        'rn': data['year_2425'].iloc[62:91]['Room nights'].sum(),
-        'adr': data['year_2425'].iloc[62:91]['ADR Cam'].mean()
-    }
-    feb_otb = {
-        'rn': data['otb_2026'].iloc[62:90]['Room nights'].sum(),
-        'adr': data['otb_2026'].iloc[62:90]['ADR Cam'].mean()
-    }
-    feb_pickup = {
-        'rn': data['pickup'].iloc[62:90]['vs 7gg'].sum(),
-        'adr': calc_pickup_adr(data['pickup'].iloc[62:90])
-    }
+    feb_fcst = month_forecast(*MONTH_WINDOWS['feb'], month_days('feb'))
     
-    feb_fcst = calculate_forecast_simple(
-        feb_baseline, feb_year, feb_otb, feb_pickup,
-        weights, biennale_adj, num_rooms * 28
-    )
-    
-    # Budget
-    budget_data = {
-        'dic': {
-            'rn': data['budget'].iloc[1]['Roomnights BDG'],
-            'adr': data['budget'].iloc[1]['ADR Room BDG'],
-            'revenue': data['budget'].iloc[1]['Room Revenue BDG'],
-            'occ': data['budget'].iloc[1]['Occ.% BDG']
-        },
-        'gen': {
-            'rn': data['budget'].iloc[2]['Roomnights BDG'],
-            'adr': data['budget'].iloc[2]['ADR Room BDG'],
-            'revenue': data['budget'].iloc[2]['Room Revenue BDG'],
-            'occ': data['budget'].iloc[2]['Occ.% BDG']
-        },
-        'feb': {
-            'rn': data['budget'].iloc[3]['Roomnights BDG'],
-            'adr': data['budget'].iloc[3]['ADR Room BDG'],
-            'revenue': data['budget'].iloc[3]['Room Revenue BDG'],
-            'occ': data['budget'].iloc[3]['Occ.% BDG']
-        }
-    }
-
 except Exception as e:
     st.error(f"❌ Errore: {e}")
     st.stop()
 
+# Archivio: un file per run distinto, solo con risultati definitivi (nessun Autopilot in corso, annullato o fallito)
+archived_run_id = None
+if not autopilot_pending and not autopilot_failed:
+    run_meta = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'report_date': report_date.strftime('%Y-%m-%d'),
+        'mode': 'Autopilot ML' if ml_used else 'Manual',
+        'inputs': {source: data_keys[source] for source in PIPELINE_STAGES['Parsing'] if source in data_keys},
+        'weights': weights,
+        'segmentation': segmentation,
+        # I pesi medi non distinguono due segmentazioni: l'id del run dipende dai pesi per giorno
+        'weights_digest': {
+            f'{metric}_{component}': weights_digest(np.asarray(values, dtype=np.float64))
+            for metric in ['rn', 'adr'] for component, values in day_weights[metric].items()
+        },
+        'events': [{'evento': e['evento'], 'rn': e['rn'], 'adr': e['adr']} for e in events],
+        'num_rooms': num_rooms,
+        'outputs': {
+            month: {k: float(v) for k, v in output.items()}
+            for month, output in [('dic', dic_total), ('gen', gen_fcst), ('feb', feb_fcst)]
+        },
+        'budget': budget_data
+    }
+    try:
+        archived_run_id, _ = archive_run(run_meta, run_columns(
+            data, data_keys, event_calendar, day_weights, season_series
+        ))
+    except OSError as e:
+        st.sidebar.warning(f"⚠️ Archivio run non scritto: {e}")
+
 # ============================================================================
 # DASHBOARD
 # ============================================================================
@@ -730,7 +2342,8 @@ with tab1:
         st.markdown(f"""
         <div class="autopilot-box">
         <strong>🤖 Modalità Autopilot Attiva</strong><br>
-        Pesi ottimizzati: Baseline {weights['baseline']:.0%} | Year {weights['year']:.0%} | OTB {weights['otb']:.0%} | Pickup {weights['pickup']:.0%}
+        Pesi RN: Baseline {weights['rn']['baseline']:.0%} | Year {weights['rn']['year']:.0%} | OTB {weights['rn']['otb']:.0%} | Pickup {weights['rn']['pickup']:.0%}<br>
+        Pesi ADR: Baseline {weights['adr']['baseline']:.0%} | Year {weights['adr']['year']:.0%} | OTB {weights['adr']['otb']:.0%} | Pickup {weights['adr']['pickup']:.0%}
         </div>
         """, unsafe_allow_html=True)
     
@@ -807,21 +2420,81 @@ with tab2:
         st.subheader("Pesi Ottimizzati")
         
         fig_weights = go.Figure()
-        fig_weights.add_trace(go.Bar(
-            x=['Baseline 2024', 'Anno 2025', 'OTB 2026', 'Pickup 7gg'],
-            y=[weights['baseline']*100, weights['year']*100, weights['otb']*100, weights['pickup']*100],
-            marker_color=['#FF6B6B', '#4ECDC4', '#45B7D1', '#FFA07A'],
-            text=[f"{weights['baseline']:.0%}", f"{weights['year']:.0%}", 
-                  f"{weights['otb']:.0%}", f"{weights['pickup']:.0%}"],
-            textposition='auto'
-        ))
+        for metric, name, color in [('rn', 'Roomnights', '#45B7D1'), ('adr', 'ADR', '#FFA07A')]:
+            fig_weights.add_trace(go.Bar(
+                name=name,
+                x=['Baseline 2024', 'Anno 2025', 'OTB 2026', 'Pickup 7gg'],
+                y=[weights[metric][c]*100 for c in GRID_COMPONENTS],
+                marker_color=color,
+                text=[f"{weights[metric][c]:.0%}" for c in GRID_COMPONENTS],
+                textposition='auto'
+            ))
         fig_weights.update_layout(
-            title='Distribuzione Pesi Ottimizzati',
+            title='Distribuzione Pesi Ottimizzati (RN vs ADR)',
             yaxis_title='Peso (%)',
+            barmode='group',
             height=400
         )
         st.plotly_chart(fig_weights, use_container_width=True)
         
+        if len(segment_labels) > 1:
+            st.subheader(f"Pesi per Segmento ({segmentation})")
+            st.caption("Il grafico sopra mostra la media dei pesi sui giorni della stagione")
+            st.dataframe(
+                segment_weights_table(weights_result), hide_index=True, use_container_width=True,
+                column_config={
+                    **{f"{c.capitalize()} {m}": st.column_config.NumberColumn(format="%.2f")
+                       for m in ['RN', 'ADR'] for c in GRID_COMPONENTS},
+                    'MAPE RN': st.column_config.NumberColumn(format="%.2f%%"),
+                    'MAPE ADR': st.column_config.NumberColumn(format="%.2f%%")
+                }
+            )
+        
+        if pareto is not None and pareto['weights']:
+            st.subheader("Fronte di Pareto RN / ADR")
+            st.caption(
+                f"{pareto['pairs']:,} coppie (pesi RN, pesi ADR) valutate; "
+                f"{len(pareto['weights'])} non dominate su MAPE RN, MAPE ADR e MAPE Revenue"
+            )
+            
+            fig_pareto = go.Figure()
+            fig_pareto.add_trace(go.Scatter(
+                x=pareto['mape_rn'], y=pareto['mape_adr'],
+                mode='markers',
+                marker=dict(size=9, color=pareto['mape_rev'], colorscale='Viridis',
+                            colorbar=dict(title='MAPE Rev %')),
+                text=[f"Punto {i}" for i in range(len(pareto['weights']))],
+                hovertemplate='%{text}<br>MAPE RN %{x:.2f}%<br>MAPE ADR %{y:.2f}%<extra></extra>',
+                name='Fronte'
+            ))
+            fig_pareto.add_trace(go.Scatter(
+                x=[mape_rn], y=[mape_adr],
+                mode='markers',
+                marker=dict(size=16, symbol='star', color='#FF6B6B'),
+                name='In uso'
+            ))
+            fig_pareto.update_layout(
+                xaxis_title='MAPE Roomnights (%)',
+                yaxis_title='MAPE ADR (%)',
+                height=450
+            )
+            st.plotly_chart(fig_pareto, use_container_width=True)
+            
+            st.selectbox(
+                "Punto del fronte in uso",
+                pareto_labels(pareto),
+                index=pareto_default(pareto),
+                key='pareto_choice'
+            )
+            st.dataframe(
+                pareto_table(pareto), hide_index=True, use_container_width=True,
+                column_config={
+                    **{f"{c.capitalize()} {m}": st.column_config.NumberColumn(format="%.2f")
+                       for m in ['RN', 'ADR'] for c in GRID_COMPONENTS},
+                    **{f"MAPE {m}": st.column_config.NumberColumn(format="%.2f%%") for m in ['RN', 'ADR', 'Revenue']}
+                }
+            )
+        
         st.info(f"""
         **Performance del Modello:**
         - MAPE Roomnights: {mape_rn:.2f}%
@@ -831,33 +2504,38 @@ with tab2:
         *MAPE < 10%: Eccellente | 10-20%: Buono | >20%: Migliorabile*
         """)
         
-        # Biennale Adjustment info
+        # Calendario eventi info
         st.markdown("---")
-        st.subheader("🎨 Biennale Adjustment")
+        st.subheader("🎭 Calendario Eventi")
         
-        if ml_biennale_used:
-            st.success(f"✅ Fattore ottimizzato automaticamente: **{biennale_adj:.2f}** (+{(biennale_adj-1)*100:.1f}%)")
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Biennale Arte", f"{biennale_adj:.2f}×", "Ottimizzato")
-            with col2:
-                uplift_pct = (biennale_adj - 1) * 100
-                st.metric("Uplift vs Architettura", f"+{uplift_pct:.1f}%", "Storico")
-            
-            st.info("""
-            **Come funziona:**
-            - Confronta Biennale Arte 2023-24 vs Architettura 2024-25
-            - Grid search trova il fattore che minimizza MAPE
-            - Applica lo stesso uplift per prevedere Arte 2026
-            
-            **Interpretazione:**
-            Storicamente, durante la Biennale Arte, Ca' di Dio registra performance superiori 
-            rispetto alla Biennale Architettura. Il fattore ottimizzato cattura questo pattern.
-            """)
+        if events_fit is not None:
+            st.success(f"✅ Moltiplicatori stimati automaticamente: {', '.join(events_fit['identified']) or 'nessuno'}")
         else:
-            st.info(f"ℹ️ Biennale Adjustment manuale: **{biennale_adj:.2f}** (+{(biennale_adj-1)*100:.1f}%)")
-            st.markdown("Passa a modalità **Auto (Grid Search ML)** per ottimizzazione automatica")
+            st.info("ℹ️ Moltiplicatori evento manuali")
+            st.markdown("Passa a modalità **Auto (Least Squares ML)** per la stima automatica")
+        
+        st.dataframe(events_table(events), hide_index=True, use_container_width=True)
+        
+        fig_events = go.Figure()
+        fig_events.add_trace(go.Scatter(x=event_calendar['dates'], y=event_calendar['rn'],
+                                        name='RN ×', line=dict(color='#366092', shape='hv')))
+        fig_events.add_trace(go.Scatter(x=event_calendar['dates'], y=event_calendar['adr'],
+                                        name='ADR ×', line=dict(color='#FFC000', shape='hv')))
+        fig_events.update_layout(
+            title='Moltiplicatori giornalieri sulla stagione',
+            yaxis_title='Moltiplicatore',
+            height=350
+        )
+        st.plotly_chart(fig_events, use_container_width=True)
+        
+        st.info("""
+        **Come funziona:**
+        - Ogni evento ha periodi datati e moltiplicatori separati per RN e ADR
+        - Il calendario è espanso in un moltiplicatore per giorno; ogni componente riceve il
+          rapporto tra gli eventi del giorno target e quelli del suo giorno storico (OTB e pickup invariati)
+        - In Auto, tutti i moltiplicatori sono stimati insieme (minimi quadrati) confrontando
+          giorno per giorno Biennale Arte 2023-24 e Architettura 2024-25
+        """)
         
     else:
         st.info("ℹ️ Modalità Manual attiva - Passa ad Autopilot per ottimizzazione ML")
@@ -900,6 +2578,76 @@ with tab3:
         height=400
     )
     st.plotly_chart(fig, use_container_width=True)
+    
+    # Serie giornaliere: tracce WebGL e downsampling lato server sulla finestra selezionata
+    st.markdown("---")
+    st.subheader("📅 Serie Giornaliere")
+    
+    series = chart_series(data, data_keys, season_series)
+    dates = series['dates']
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        chart_metric = st.selectbox("Metrica", list(CHART_METRICS))
+    with col2:
+        chart_points = st.select_slider("Punti per serie", CHART_RESOLUTIONS, value=CHART_DEFAULT_POINTS,
+                                        help="Risoluzione inviata al browser: circa la larghezza del grafico in pixel")
+    with col3:
+        chart_method = st.radio("Downsampling", ["LTTB", "Min/Max"], horizontal=True,
+                                help="LTTB preserva la forma della curva, Min/Max conserva i picchi")
+    
+    # La finestra visibile: cambiandola si richiede il dettaglio solo per quel periodo
+    first_day, last_day = dates[0].item(), dates[-1].item()
+    window_start, window_stop = st.slider(
+        "Finestra visibile", min_value=first_day, max_value=last_day,
+        value=(first_day, last_day), format="DD/MM/YYYY"
+    )
+    window_start, window_stop = np.datetime64(window_start), np.datetime64(window_stop)
+    
+    metric_key = CHART_METRICS[chart_metric]
+    fig_daily = go.Figure()
+    sent = total = 0
+    for name, color, dash in [('OTB 2026', '#366092', None), ('Forecast', '#4CAF50', None),
+                              ('Anno scorso', '#999999', 'dot'), ('Budget', '#FFC000', 'dash')]:
+        values = series[name][metric_key]
+        x, y = downsample(dates, values, window_start, window_stop, chart_points, chart_method)
+        total += int(((dates >= window_start) & (dates <= window_stop) & np.isfinite(values)).sum())
+        sent += len(x)
+        fig_daily.add_trace(go.Scattergl(
+            x=x, y=y, name=name, mode='lines',
+            line=dict(color=color, dash=dash)
+        ))
+    fig_daily.update_layout(
+        title=f'{chart_metric} giornaliero: OTB vs Forecast vs Anno scorso vs Budget',
+        yaxis_title=chart_metric,
+        hovermode='x unified',
+        height=450
+    )
+    st.plotly_chart(fig_daily, use_container_width=True)
+    
+    # Pickup pace: pickup giornaliero e cumulato sulla finestra
+    pickup_rn = series['Pickup 7gg']['rn']
+    x, y = downsample(dates, pickup_rn, window_start, window_stop, chart_points, chart_method)
+    window = (dates >= window_start) & (dates <= window_stop)
+    x_cum, y_cum = downsample(dates[window], np.nancumsum(pickup_rn[window]), window_start, window_stop,
+                              chart_points, chart_method)
+    total += int((window & np.isfinite(pickup_rn)).sum()) + int(window.sum())
+    sent += len(x) + len(x_cum)
+    
+    fig_pace = go.Figure()
+    fig_pace.add_trace(go.Scattergl(x=x, y=y, name='Pickup 7gg', mode='lines+markers',
+                                    marker=dict(size=4), line=dict(color='#FFA07A')))
+    fig_pace.add_trace(go.Scattergl(x=x_cum, y=y_cum, name='Pickup cumulato', mode='lines',
+                                    line=dict(color='#366092'), yaxis='y2'))
+    fig_pace.update_layout(
+        title='Pickup Pace (roomnights ultimi 7 giorni)',
+        yaxis=dict(title='RN per giorno'),
+        yaxis2=dict(title='RN cumulate', overlaying='y', side='right'),
+        hovermode='x unified',
+        height=400
+    )
+    st.plotly_chart(fig_pace, use_container_width=True)
+    st.caption(f"{sent:,} punti inviati al browser su {total:,} nella finestra ({chart_method})")
 
 with tab4:
     st.header("💾 Export Risultati")
@@ -914,6 +2662,8 @@ with tab4:
     })
     
     st.dataframe(export_df, use_container_width=True, hide_index=True)
+    if archived_run_id is not None:
+        st.caption(f"🗄️ Run archiviato come `{archived_run_id}` (consultabile dalla vista Archivio run)")
     
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -926,9 +2676,66 @@ with tab4:
         "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
 
+# ============================================================================
+# SIDEBAR - PIPELINE INCREMENTALE
+# ============================================================================
+
+# Al cambio di un file si conserva il log del run che ha ricalcolato, per verificare i risparmi
+changed = changed_sources(st.session_state.get('pipeline_keys', {}), data_keys)
+if changed:
+    st.session_state['pipeline_keys'] = dict(data_keys)
+    st.session_state['pipeline_last_change'] = {
+        'changed': changed,
+        'log': {stage: dict(counts) for stage, counts in pipeline_log.items()},
+        'when': datetime.now()
+    }
+
+with st.sidebar.expander("🔁 Pipeline incrementale"):
+    last_change = st.session_state.get('pipeline_last_change')
+    if last_change is not None:
+        st.write(f"**Ultimo cambio file** ({last_change['when'].strftime('%H:%M:%S')}): "
+                 f"{', '.join(last_change['changed'])}")
+        st.dataframe(pipeline_report(last_change['log'], last_change['changed']),
+                     hide_index=True, use_container_width=True)
+    st.write("**Questo run:**")
+    st.dataframe(pipeline_report(pipeline_log, []), hide_index=True, use_container_width=True)
+
+# ============================================================================
+# SIDEBAR - ADMIN CACHE CONDIVISA
+# ============================================================================
+
+store = shared_store()
+with st.sidebar.expander("🗄️ Cache condivisa (admin)"):
+    st.write(f"**Residente:** {store.resident_bytes / 1024 ** 2:.1f} MB / {store.max_bytes / 1024 ** 2:.0f} MB")
+    st.write(f"**Hit:** {store.hits} | **Miss:** {store.misses} | **Evictions:** {store.evictions}")
+    resident = store.snapshot()
+    if resident:
+        st.dataframe(pd.DataFrame(resident), hide_index=True, use_container_width=True)
+    
+    # Tetto e svuotamento agiscono su tutte le sessioni: solo con il token admin
+    if not CACHE_ADMIN_TOKEN:
+        st.caption("Controlli admin disabilitati: imposta CACHE_ADMIN_TOKEN per abilitarli")
+    elif hmac.compare_digest(st.text_input("Token admin", type="password"), CACHE_ADMIN_TOKEN):
+        max_mb = st.number_input("Tetto memoria (MB)", min_value=16, value=int(store.max_bytes / 1024 ** 2), step=64)
+        if st.button("💾 Applica tetto"):
+            store.resize(int(max_mb * 1024 ** 2))
+            st.rerun()
+        if st.button("🧹 Svuota cache (tutte le sessioni)"):
+            store.clear()
+            st.rerun()
+
 st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: #666;'>
     <strong>Ca' di Dio Vretreats</strong> - ML Autopilot 🤖 | Powered by Streamlit
 </div>
 """, unsafe_allow_html=True)
+
+# Aggiornamento automatico finché ci sono risultati Autopilot non definitivi
+if autopilot_pending:
+    time.sleep(AUTOPILOT_POLL_SECONDS)
+    st.rerun()
+
+# Cartella monitorata: si ricalcola alla prossima acquisizione
+if ingest_mode == "Cartella monitorata":
+    listen_for_drops(watcher, watch_version, watch_status)